@@ -42,6 +42,15 @@ CREATE TABLE IF NOT EXISTS messages (
     storage_urls JSONB DEFAULT '[]'
 );
 
+-- Create processed_messages table (one row per Twilio MessageSid, so retried webhooks are processed once)
+-- status: 'processing' while claimed, 'committed' once its task updates have started, 'done' with its outcome
+CREATE TABLE IF NOT EXISTS processed_messages (
+    message_sid TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'processing',
+    outcome JSONB,
+    claimed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- Create indexes
 CREATE INDEX IF NOT EXISTS idx_users_phone_number ON users(phone_number);
 CREATE INDEX IF NOT EXISTS idx_tasks_user_id ON tasks(user_id);
@@ -56,6 +65,7 @@ COMMENT ON TABLE users IS 'User accounts with points system';
 COMMENT ON TABLE tasks IS 'Tasks assigned to users';
 COMMENT ON TABLE feed IS 'Feed of completed tasks with images';
 COMMENT ON TABLE messages IS 'Stores incoming messages from Twilio (SMS and WhatsApp)';
+COMMENT ON TABLE processed_messages IS 'Processing status and outcome of each inbound Twilio message, keyed by MessageSid';
 
 -- Create a bucket for storing media files in Supabase Storage
 -- Note: This needs to be run in the Supabase SQL editor or via the Supabase API
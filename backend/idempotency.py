@@ -0,0 +1,168 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from postgrest.exceptions import APIError
+
+# Postgres error code for a unique constraint violation
+UNIQUE_VIOLATION = "23505"
+
+
+class MessageInProgress(Exception):
+    """
+    Raised for a message whose claim is held by another worker that hasn't finished yet
+    """
+
+
+class MessageDeduplicator:
+    """
+    Makes inbound Twilio message processing idempotent on MessageSid.
+
+    The processed_messages table (message_sid is its primary key) is the source of truth:
+    claim() inserts the sid before any expensive work, and only the caller whose insert
+    succeeds processes the message. complete() stores the outcome, so a retried webhook is
+    answered with the original result. A bounded in-memory LRU of finished sids sits in
+    front of the table, so most retries never reach the database at all.
+
+    A claim that was never completed (the worker died mid-message) can be taken over after
+    stale_after seconds, so a crash doesn't lose the message. commit() marks a claim whose
+    worker is about to make writes that aren't safe to repeat; a committed claim is never
+    taken over, and once stale it is recorded as done instead of being processed again.
+    """
+
+    def __init__(self, supabase, max_entries: int = 10000, stale_after: float = 600,
+                 complete_attempts: int = 4, complete_backoff: float = 0.5):
+        self.supabase = supabase
+        self.max_entries = max_entries
+        self.stale_after = stale_after
+        self.complete_attempts = complete_attempts
+        self.complete_backoff = complete_backoff
+        self._outcomes = OrderedDict()  # message_sid -> outcome
+        self.hits = 0
+        self.duplicates = 0
+
+    def cached_outcome(self, message_sid: str):
+        """
+        Get the outcome of an already processed message from memory, or None
+        """
+        outcome = self._outcomes.get(message_sid)
+        if outcome is not None:
+            self._outcomes.move_to_end(message_sid)
+            self.hits += 1
+        return outcome
+
+    def _remember(self, message_sid: str, outcome: dict):
+        self._outcomes[message_sid] = outcome
+        self._outcomes.move_to_end(message_sid)
+        while len(self._outcomes) > self.max_entries:
+            self._outcomes.popitem(last=False)
+
+    async def claim(self, message_sid: str):
+        """
+        Claim a message for processing
+
+        Returns (True, None) if the caller should process it, or (False, outcome) if it was
+        already processed (outcome is None while another worker is still on it).
+        """
+        outcome = self.cached_outcome(message_sid)
+        if outcome is not None:
+            self.duplicates += 1
+            return False, outcome
+
+        now = datetime.now(timezone.utc)
+        try:
+            await self.supabase.table("processed_messages").insert({
+                "message_sid": message_sid,
+                "status": "processing",
+                "claimed_at": now.isoformat()
+            }).execute()
+            return True, None
+        except APIError as e:
+            if e.code != UNIQUE_VIOLATION:
+                raise
+
+        # Someone has seen this sid before
+        self.duplicates += 1
+        existing = (await self.supabase.table("processed_messages").select("status, outcome, claimed_at").eq("message_sid", message_sid).single().execute()).data
+        if existing["status"] == "done":
+            self._remember(message_sid, existing["outcome"])
+            return False, existing["outcome"]
+
+        stale_before = (now - timedelta(seconds=self.stale_after)).isoformat()
+        if existing["status"] == "committed":
+            # Its worker started the task updates but never recorded the outcome; processing
+            # it again would repeat those writes, so once stale it is closed out instead
+            outcome = {"success": False, "message": "Processing was interrupted after the task was updated"}
+            closed = await self.supabase.table("processed_messages")\
+                .update({"status": "done", "outcome": outcome})\
+                .eq("message_sid", message_sid)\
+                .eq("status", "committed")\
+                .lt("claimed_at", stale_before)\
+                .execute()
+            if not closed.data:
+                return False, None
+            self._remember(message_sid, outcome)
+            return False, outcome
+
+        # Take over a claim whose worker never finished
+        takeover = await self.supabase.table("processed_messages")\
+            .update({"claimed_at": now.isoformat()})\
+            .eq("message_sid", message_sid)\
+            .eq("status", "processing")\
+            .lt("claimed_at", stale_before)\
+            .execute()
+        if takeover.data:
+            return True, None
+        return False, None
+
+    async def commit(self, message_sid: str):
+        """
+        Mark a claimed message as past the point where it can safely be processed again
+        """
+        await self.supabase.table("processed_messages")\
+            .update({"status": "committed", "claimed_at": datetime.now(timezone.utc).isoformat()})\
+            .eq("message_sid", message_sid)\
+            .execute()
+
+    async def complete(self, message_sid: str, outcome: dict):
+        """
+        Record the outcome of a processed message
+
+        Retried with backoff on its own: the message's work is already done, so a failure
+        here must not send the whole message back through processing.
+        """
+        for attempt in range(self.complete_attempts):
+            try:
+                await self.supabase.table("processed_messages")\
+                    .update({"status": "done", "outcome": outcome})\
+                    .eq("message_sid", message_sid)\
+                    .execute()
+                break
+            except Exception as e:
+                if attempt == self.complete_attempts - 1:
+                    raise
+                print(f"Error recording outcome of message {message_sid}, retrying: {str(e)}")
+                await asyncio.sleep(self.complete_backoff * 2 ** attempt)
+        self._remember(message_sid, outcome)
+
+    async def release(self, message_sid: str):
+        """
+        Drop the claim of a message whose processing failed, so a retry can process it again
+        """
+        try:
+            await self.supabase.table("processed_messages")\
+                .delete()\
+                .eq("message_sid", message_sid)\
+                .in_("status", ["processing", "committed"])\
+                .execute()
+        except Exception as e:
+            print(f"Error releasing claim on message {message_sid}: {str(e)}")
+
+    def stats(self):
+        """
+        Get the deduplicator's counters
+        """
+        return {
+            "cached": len(self._outcomes),
+            "cache_hits": self.hits,
+            "duplicates": self.duplicates
+        }
@@ -10,18 +10,60 @@ from sms_service import (
     process_incoming_message, 
     process_incoming_message_with_storage,
     get_media_as_base64, 
-    download_media
+    fetch_media,
+    close_media_client
 )
 
+from twilio.request_validator import RequestValidator
+from webhook_queue import WebhookQueue
+from idempotency import MessageDeduplicator, MessageInProgress
+
+from contextlib import asynccontextmanager
 from typing import Dict, List, Optional
+import asyncio
 import json
 import os
 
-app = FastAPI()
-
 # Check if we're running on Railway
 IS_RAILWAY = os.environ.get("RAILWAY_ENVIRONMENT") is not None
 
+# Inbound Twilio webhooks are persisted here and processed by WEBHOOK_WORKERS background workers
+webhook_queue = WebhookQueue(
+    db_path=os.environ.get("WEBHOOK_QUEUE_DB", "webhook_queue.db"),
+    max_attempts=int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "5"))
+)
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "4"))
+WEBHOOK_POLL_SECONDS = 1.0
+
+# Each MessageSid is processed once, even when Twilio retries the webhook
+message_deduplicator = MessageDeduplicator(supabase)
+# How long a job waits before checking again on a message another worker is still processing
+# (without using up an attempt, so it outlives a crashed worker's claim until it goes stale)
+IN_PROGRESS_RECHECK_SECONDS = 30
+
+# Public URL of the webhook as configured in Twilio; when set, request signatures are checked against it
+TWILIO_WEBHOOK_URL = os.environ.get("TWILIO_WEBHOOK_URL")
+webhook_validator = RequestValidator(os.environ.get("TWILIO_AUTH_TOKEN", ""))
+
+# Set when a payload is enqueued, so idle workers wake up right away (created in the app's event loop)
+webhook_jobs_ready: asyncio.Event = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global webhook_jobs_ready
+    await supabase.connect()
+    webhook_jobs_ready = asyncio.Event()
+    workers = [asyncio.create_task(webhook_worker(i)) for i in range(WEBHOOK_WORKERS)]
+    yield
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    webhook_queue.close()
+    await close_media_client()
+    await supabase.close()
+
+app = FastAPI(lifespan=lifespan)
+
 class User(BaseModel):
     username: str
     phone_number: str
@@ -74,21 +116,21 @@ class FeedPost(BaseModel):
 
 @app.post("/users/")
 async def create_user(user: User):
-    response = supabase.table("users").insert(user.model_dump()).execute()
+    response = await supabase.table("users").insert(user.model_dump()).execute()
     if response.data:
         return {"message": "User registered", "user": response.data}
     raise HTTPException(status_code=400, detail="Error registering user")
 
 @app.post("/tasks/")
 async def create_task(task: Task):
-    response = supabase.table("tasks").insert(task.model_dump()).execute()
+    response = await supabase.table("tasks").insert(task.model_dump()).execute()
     if response.data:
         return {"message": "Task created", "task": response.data}
     raise HTTPException(status_code=400, detail="Error creating task")
 
 @app.get("/tasks/{task_id}")
 async def get_task(task_id: int):
-    response = supabase.table("tasks").select("*").eq("task_id", task_id).single().execute()
+    response = await supabase.table("tasks").select("*").eq("task_id", task_id).single().execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="Task not found")
     task = Task(**response.data)
@@ -96,7 +138,7 @@ async def get_task(task_id: int):
 
 @app.get("/users/{user_id}")
 async def get_user(user_id: int):
-    response = supabase.table("users").select("*").eq("user_id", user_id).single().execute()
+    response = await supabase.table("users").select("*").eq("user_id", user_id).single().execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="User not found")
     user = User(**response.data)
@@ -104,7 +146,7 @@ async def get_user(user_id: int):
 
 @app.post("/feed/")
 async def post_to_feed(feed_post: FeedPost):
-    response = supabase.table("feed").insert(feed_post.model_dump()).execute()
+    response = await supabase.table("feed").insert(feed_post.model_dump()).execute()
     if response.data:
         return {"message": "Feed post created", "feed_post": response.data}
     raise HTTPException(status_code=400, detail="Error creating feed post")
@@ -112,13 +154,13 @@ async def post_to_feed(feed_post: FeedPost):
 # Feed of a specific user
 @app.get("/feed/{user_id}")
 async def get_user_feed(user_id: int):
-    response = supabase.table("feed").select("*").eq("user_id", user_id).execute()
+    response = await supabase.table("feed").select("*").eq("user_id", user_id).execute()
     return response.data if response.data else {"message": "No posts found"}
 
 # For universal feed
 @app.get("/feed/")
 async def get_all_feed_posts():
-    response = supabase.table("feed").select("*").execute()
+    response = await supabase.table("feed").select("*").execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="No feed posts found")
     feed_posts = [FeedPost(**post) for post in response.data]
@@ -126,7 +168,7 @@ async def get_all_feed_posts():
 
 @app.post("/message/")
 async def send_text(phone_number: str, message: str):
-    send_whatsapp_message(phone_number, message)
+    await asyncio.to_thread(send_whatsapp_message, phone_number, message)
     return {"message": "Message sent successfully"}
 
 @app.post("/webhook/twilio")
@@ -135,6 +177,9 @@ async def twilio_webhook(request: Request):
     Webhook endpoint for receiving messages from Twilio.
     This handles both SMS and WhatsApp messages, including media (images).
     
+    The payload is validated and persisted to the durable webhook queue, and Twilio gets
+    its 200 right away; background workers do the actual processing (see process_twilio_message).
+    
     Configure this URL in your Twilio console:
     1. Go to https://www.twilio.com/console/phone-numbers/incoming
     2. Select your phone number
@@ -144,10 +189,86 @@ async def twilio_webhook(request: Request):
     form_data = await request.form()
     message_data = dict(form_data)
     
+    # Only accept requests signed by Twilio when the public webhook URL is configured
+    if TWILIO_WEBHOOK_URL and not webhook_validator.validate(
+        TWILIO_WEBHOOK_URL, message_data, request.headers.get("X-Twilio-Signature", "")
+    ):
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+    
+    if not message_data.get("MessageSid") or not message_data.get("From"):
+        raise HTTPException(status_code=400, detail="Missing MessageSid or From")
+    
+    # A retry of a message that was already processed gets the original outcome
+    message_sid = message_data["MessageSid"]
+    outcome = message_deduplicator.cached_outcome(message_sid)
+    if outcome is not None:
+        return JSONResponse(content={**outcome, "duplicate": True})
+    
+    # A retry of a message that's still waiting in the queue isn't queued twice
+    # The SQLite write (and its fsync) runs off the event loop, like the workers' queue calls
+    job_id = await asyncio.to_thread(webhook_queue.enqueue, message_data, message_sid)
+    if job_id is None:
+        return JSONResponse(content={"success": True, "message": "Webhook already queued", "duplicate": True})
+    webhook_jobs_ready.set()
+    
+    return JSONResponse(content={"success": True, "message": "Webhook queued for processing"})
+
+@app.get("/webhook/twilio/queue")
+async def twilio_webhook_queue():
+    """
+    Depth and lag of the webhook processing queue, and duplicate deliveries caught
+    """
+    return {**webhook_queue.stats(), "deduplication": message_deduplicator.stats()}
+
+@app.get("/supabase/pool")
+async def supabase_pool():
+    """
+    Usage of the Supabase connection pools: requests in flight, peak and saturation counters
+    """
+    return supabase.stats()
+
+async def process_twilio_message(message_data):
+    """
+    Process one inbound Twilio message: store its media, record it and complete the sender's task.
+    
+    Runs on a webhook worker. Raises on failure so the job is retried, unless the failure
+    came after the task, feed or points were already written: retrying then would award the
+    points twice, so the message is recorded as processed instead. A message whose
+    MessageSid was already processed is skipped and its original outcome returned.
+    
+    :param message_data: The form data Twilio posted to the webhook
+    :return: Dictionary describing the outcome
+    """
+    message_sid = message_data.get("MessageSid")
+    is_new, outcome = await message_deduplicator.claim(message_sid)
+    if not is_new:
+        if outcome is None:
+            # Another worker is still processing it; check again later
+            raise MessageInProgress(f"Message {message_sid} is already being processed")
+        print(f"Skipping already processed message {message_sid}")
+        return outcome
+    
+    progress = {"committed": False}
+    try:
+        outcome = await _process_twilio_message(message_data, progress)
+    except Exception as e:
+        if not progress["committed"]:
+            await message_deduplicator.release(message_sid)
+            raise
+        print(f"Message {message_sid} failed after its task was updated; not retrying: {str(e)}")
+        outcome = {"success": False, "message": "Processing failed after the task was updated"}
+    try:
+        await message_deduplicator.complete(message_sid, outcome)
+    except Exception as e:
+        # The message was handled; a redelivery finds its claim and isn't processed again
+        print(f"Error recording outcome of message {message_sid}: {str(e)}")
+    return outcome
+
+async def _process_twilio_message(message_data, progress):
     # Process the incoming message
     # If running on Railway, use Supabase Storage for media
     if IS_RAILWAY:
-        processed_message = process_incoming_message_with_storage(message_data, bucket_name="notes")
+        processed_message = await process_incoming_message_with_storage(message_data, bucket_name="notes")
     else:
         processed_message = process_incoming_message(message_data)
     
@@ -156,13 +277,13 @@ async def twilio_webhook(request: Request):
         from_number = processed_message["from_number"]
         
         # Find the user by phone number
-        user_response = supabase.table("users").select("*").eq("phone_number", from_number).execute()
+        user_response = await supabase.table("users").select("*").eq("phone_number", from_number).execute()
         
         if not user_response.data:
             # User not found, create a default response
             auto_reply = "Thanks for your message! Please register first to use our service."
-            send_whatsapp_message(from_number, auto_reply)
-            return JSONResponse(content={"success": True, "message": "User not found"})
+            await asyncio.to_thread(send_whatsapp_message, from_number, auto_reply)
+            return {"success": True, "message": "User not found"}
         
         user = user_response.data[0]
         user_id = user.get("id")
@@ -177,17 +298,21 @@ async def twilio_webhook(request: Request):
             "media_items": json.dumps(processed_message["media_items"])
         }
         
-        supabase.table("messages").insert(message_record).execute()
+        # Upsert, so a retry after a partial failure doesn't trip over message_sid's unique constraint
+        await supabase.table("messages").upsert(message_record, on_conflict="message_sid").execute()
         
         # Check if this is a task completion (has media)
         if processed_message["num_media"] > 0:
             # Get the most recent active task for this user
-            task_response = supabase.table("tasks").select("*").eq("user_id", user_id).eq("status", "active").order("created_at", desc=True).limit(1).execute()
+            task_response = await supabase.table("tasks").select("*").eq("user_id", user_id).eq("status", "active").order("created_at", desc=True).limit(1).execute()
             
             if task_response.data:
                 task = task_response.data[0]
                 task_id = task.get("id")
                 
+                # A worker that dies past this point leaves a claim that is never taken over
+                await message_deduplicator.commit(processed_message["message_sid"])
+                
                 # Create a feed post for the completed task
                 for media_item in processed_message["media_items"]:
                     image_url = None
@@ -208,14 +333,16 @@ async def twilio_webhook(request: Request):
                         "post_content": processed_message["body"] if processed_message["body"] else "Task completed"
                     }
                     
-                    supabase.table("feed").insert(feed_post).execute()
+                    await supabase.table("feed").insert(feed_post).execute()
+                    # A feed post now exists, so the writes from here on aren't safe to repeat
+                    progress["committed"] = True
                 
                 # Update the task status to completed
-                supabase.table("tasks").update({"status": "completed"}).eq("id", task_id).execute()
+                await supabase.table("tasks").update({"status": "completed"}).eq("id", task_id).execute()
                 
                 # Award points to the user
                 new_points = user.get("points", 0) + 10  # Award 10 points for completing a task
-                supabase.table("users").update({"points": new_points}).eq("id", user_id).execute()
+                await supabase.table("users").update({"points": new_points}).eq("id", user_id).execute()
                 
                 auto_reply = f"Great job completing your task! You've earned 10 points. Your new total is {new_points} points."
             else:
@@ -226,13 +353,39 @@ async def twilio_webhook(request: Request):
             auto_reply = f"Thanks for your message: '{processed_message['body']}'. To complete a task, please send an image."
         
         # Send the auto-reply
-        send_whatsapp_message(from_number, auto_reply)
+        await asyncio.to_thread(send_whatsapp_message, from_number, auto_reply)
         
-        return JSONResponse(content={"success": True, "message": "Webhook processed successfully"})
+        return {"success": True, "message": "Webhook processed successfully"}
     
     except Exception as e:
         print(f"Error processing webhook: {str(e)}")
-        return JSONResponse(content={"success": False, "error": str(e)}, status_code=500)
+        raise
+
+
+async def webhook_worker(worker_id: int):
+    """
+    Process queued webhook payloads until the app shuts down
+    """
+    while True:
+        job = await asyncio.to_thread(webhook_queue.claim)
+        if job is None:
+            # Sleep until the webhook enqueues something, polling for retries that come due
+            webhook_jobs_ready.clear()
+            try:
+                await asyncio.wait_for(webhook_jobs_ready.wait(), WEBHOOK_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        try:
+            await process_twilio_message(job["payload"])
+            await asyncio.to_thread(webhook_queue.ack, job["id"])
+        except MessageInProgress as e:
+            print(f"Webhook worker {worker_id}: job {job['id']} deferred: {str(e)}")
+            await asyncio.to_thread(webhook_queue.defer, job["id"], IN_PROGRESS_RECHECK_SECONDS)
+        except Exception as e:
+            print(f"Webhook worker {worker_id}: job {job['id']} failed (attempt {job['attempts']}): {str(e)}")
+            await asyncio.to_thread(webhook_queue.retry, job["id"], str(e))
 
 @app.get("/messages/")
 async def get_messages(limit: int = 10, offset: int = 0, from_number: Optional[str] = None):
@@ -251,7 +404,7 @@ async def get_messages(limit: int = 10, offset: int = 0, from_number: Optional[s
         if from_number:
             query = query.eq("from_number", from_number)
         
-        response = query.execute()
+        response = await query.execute()
         
         if not response.data:
             return {"messages": []}
@@ -276,7 +429,7 @@ async def get_message(message_id: int):
     :return: The message details
     """
     try:
-        response = supabase.table("messages").select("*").eq("id", message_id).single().execute()
+        response = await supabase.table("messages").select("*").eq("id", message_id).single().execute()
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Message not found")
@@ -304,7 +457,7 @@ async def get_message_media(message_id: int, media_index: int, as_base64: bool =
     """
     try:
         # Get the message from the database
-        response = supabase.table("messages").select("*").eq("id", message_id).single().execute()
+        response = await supabase.table("messages").select("*").eq("id", message_id).single().execute()
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Message not found")
@@ -326,14 +479,14 @@ async def get_message_media(message_id: int, media_index: int, as_base64: bool =
         
         if as_base64:
             # Return the media as base64
-            media_data = get_media_as_base64(media_url)
+            media_data = await asyncio.to_thread(get_media_as_base64, media_url)
             if media_data:
                 return media_data
             else:
                 raise HTTPException(status_code=500, detail="Failed to download media")
         else:
             # Return the media as raw binary
-            content, content_type = download_media(media_url)
+            content, content_type = await fetch_media(media_url)
             if content and content_type:
                 return Response(content=content, media_type=content_type)
             else:
@@ -1,11 +1,13 @@
 from twilio.rest import Client
 from dotenv import load_dotenv
 import os
+import asyncio
+import httpx
 import requests
 import base64
 from io import BytesIO
 import uuid
-from supabase_client import upload_to_storage, get_public_url
+from supabase_client import stream_to_storage, get_public_url
 
 load_dotenv()
 
@@ -20,6 +22,25 @@ TWILIO_WHATSAPP_NUMBER = os.environ.get("TWILIO_WHATSAPP_NUMBER")
 # Initialize Twilio client
 client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
+# Media fetching: how many items are in flight at once, per message and across the whole process
+MEDIA_PER_MESSAGE_CONCURRENCY = int(os.environ.get("MEDIA_PER_MESSAGE_CONCURRENCY", "5"))
+MEDIA_GLOBAL_CONCURRENCY = int(os.environ.get("MEDIA_GLOBAL_CONCURRENCY", "20"))
+# Deadline (seconds) for downloading and storing a single media item
+MEDIA_ITEM_TIMEOUT = float(os.environ.get("MEDIA_ITEM_TIMEOUT", "30"))
+# Largest media item stored (WhatsApp allows up to 16MB), and the chunk size it's streamed in
+MAX_MEDIA_BYTES = int(os.environ.get("MAX_MEDIA_BYTES", str(16 * 1024 * 1024)))
+MEDIA_CHUNK_SIZE = 64 * 1024
+
+media_semaphore = asyncio.Semaphore(MEDIA_GLOBAL_CONCURRENCY)
+
+# Keep-alive client shared by every media download, so items reuse connections to Twilio
+media_client = httpx.AsyncClient(
+    auth=(TWILIO_ACCOUNT_SID or "", TWILIO_AUTH_TOKEN or ""),
+    follow_redirects=True,  # Twilio media URLs redirect to the file's CDN location
+    timeout=httpx.Timeout(MEDIA_ITEM_TIMEOUT, connect=5),
+    limits=httpx.Limits(max_connections=MEDIA_GLOBAL_CONCURRENCY, max_keepalive_connections=MEDIA_GLOBAL_CONCURRENCY)
+)
+
 # def send_sms(to_phone_number: int, body: str):
 #     """
 #     Sends an SMS using Twilio's API.
@@ -117,6 +138,28 @@ def download_media(media_url):
         print(f"Error downloading media: {str(e)}")
         return None, None
 
+async def fetch_media(media_url):
+    """
+    Download media from a Twilio media URL over the shared keep-alive client.
+    
+    :param media_url: The URL of the media to download
+    :return: Tuple of (content, content_type)
+    """
+    try:
+        response = await media_client.get(media_url)
+        
+        if response.status_code == 200:
+            return response.content, response.headers.get('Content-Type')
+        else:
+            print(f"Failed to download media: {response.status_code}")
+            return None, None
+    except Exception as e:
+        print(f"Error downloading media: {str(e)}")
+        return None, None
+
+async def close_media_client():
+    await media_client.aclose()
+
 def get_media_as_base64(media_url):
     """
     Download media from a Twilio media URL and convert it to base64.
@@ -162,46 +205,107 @@ def save_media_to_file(media_url, file_path):
     
     return False
 
-def save_media_to_supabase(media_url, bucket_name="notes"):
+class MediaTooLarge(Exception):
+    pass
+
+async def capped_chunks(chunks, max_bytes):
     """
-    Download media from a Twilio media URL and save it to Supabase Storage.
+    Pass chunks through, raising MediaTooLarge once more than max_bytes have gone by
+    """
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > max_bytes:
+            raise MediaTooLarge(f"Media is larger than {max_bytes} bytes")
+        yield chunk
+
+async def save_media_to_supabase(media_url, bucket_name="notes"):
+    """
+    Stream media from a Twilio media URL into Supabase Storage.
+    
+    The Twilio response body is piped into the upload chunk by chunk, so only a few chunks
+    are in memory at a time whatever the size of the media. Media whose Content-Length is
+    over MAX_MEDIA_BYTES is refused before any of it is downloaded.
     
     :param media_url: The URL of the media to download
     :param bucket_name: The name of the Supabase Storage bucket to save to (default: "notes")
     :return: Dictionary with file information or None if failed
     """
-    content, content_type = download_media(media_url)
-    
-    if content and content_type:
-        try:
+    try:
+        async with media_client.stream("GET", media_url) as response:
+            if response.status_code != 200:
+                print(f"Failed to download media: {response.status_code}")
+                return None
+            
+            content_type = response.headers.get('Content-Type')
+            if not content_type:
+                print(f"Media has no content type: {media_url}")
+                return None
+            
+            content_length = response.headers.get('Content-Length')
+            content_length = int(content_length) if content_length and content_length.isdigit() else None
+            if content_length is not None and content_length > MAX_MEDIA_BYTES:
+                print(f"Media too large to store ({content_length} bytes): {media_url}")
+                return None
+            
             # Generate a unique filename
-            extension = content_type.split('/')[-1]
+            extension = content_type.split(';')[0].split('/')[-1]
             if extension == 'jpeg':
                 extension = 'jpg'
             
             filename = f"{uuid.uuid4()}.{extension}"
             
-            # Upload to Supabase Storage
-            upload_to_storage(bucket_name, filename, content, content_type)
+            # A compressed body is decoded on the way, so its Content-Length isn't the stored size
+            if response.headers.get('Content-Encoding'):
+                content_length = None
             
-            # Get the public URL
-            public_url = get_public_url(bucket_name, filename)
-            
-            return {
-                "filename": filename,
-                "content_type": content_type,
-                "public_url": public_url,
-                "bucket": bucket_name
-            }
-        except Exception as e:
-            print(f"Error saving media to Supabase: {str(e)}")
+            # Stream the body to Supabase Storage
+            await stream_to_storage(
+                bucket_name,
+                filename,
+                capped_chunks(response.aiter_bytes(MEDIA_CHUNK_SIZE), MAX_MEDIA_BYTES),
+                content_type,
+                content_length
+            )
+        
+        # Get the public URL
+        public_url = await get_public_url(bucket_name, filename)
+        
+        return {
+            "filename": filename,
+            "content_type": content_type,
+            "public_url": public_url,
+            "bucket": bucket_name
+        }
+    except Exception as e:
+        print(f"Error saving media to Supabase: {str(e)}")
     
     return None
 
-def process_incoming_message_with_storage(message_data, store_media=True, bucket_name="notes"):
+async def store_media_item(media_item, bucket_name, message_semaphore):
+    """
+    Save one media item to Supabase Storage within the per-message and global concurrency
+    limits, giving up on it after MEDIA_ITEM_TIMEOUT seconds.
+    """
+    async with message_semaphore, media_semaphore:
+        try:
+            storage_info = await asyncio.wait_for(
+                save_media_to_supabase(media_item["url"], bucket_name),
+                MEDIA_ITEM_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            print(f"Timed out saving media to Supabase: {media_item['url']}")
+            return
+    if storage_info:
+        media_item["storage"] = storage_info
+
+async def process_incoming_message_with_storage(message_data, store_media=True, bucket_name="notes"):
     """
     Process incoming messages from Twilio (SMS or WhatsApp) and store media in Supabase Storage.
     
+    Media items are downloaded and stored concurrently, so a message takes about as long
+    as its slowest item.
+    
     :param message_data: The message data from Twilio webhook
     :param store_media: Whether to store media in Supabase Storage
     :param bucket_name: The name of the Supabase Storage bucket to save to (default: "notes")
@@ -223,18 +327,18 @@ def process_incoming_message_with_storage(message_data, store_media=True, bucket
         media_content_type = message_data.get(f"MediaContentType{i}")
         
         if media_url:
-            media_item = {
+            result["media_items"].append({
                 "url": media_url,
                 "content_type": media_content_type
-            }
-            
-            # Store media in Supabase Storage if requested
-            if store_media:
-                storage_info = save_media_to_supabase(media_url, bucket_name)
-                if storage_info:
-                    media_item["storage"] = storage_info
-            
-            result["media_items"].append(media_item)
+            })
+    
+    # Store media in Supabase Storage if requested
+    if store_media and result["media_items"]:
+        message_semaphore = asyncio.Semaphore(MEDIA_PER_MESSAGE_CONCURRENCY)
+        await asyncio.gather(*(
+            store_media_item(media_item, bucket_name, message_semaphore)
+            for media_item in result["media_items"]
+        ))
     
     return result
 
@@ -1,21 +1,187 @@
 import os
+import httpx
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from postgrest import AsyncPostgrestClient
+from storage3 import AsyncStorageClient
+from storage3.exceptions import StorageApiError
+from supabase import AsyncClient, AsyncClientOptions
 
 load_dotenv()
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 
-print(SUPABASE_URL)
-print(SUPABASE_KEY)
+# Connection pool shared by every request the backend makes to Supabase
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_MAX_KEEPALIVE = int(os.environ.get("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.environ.get("SUPABASE_KEEPALIVE_EXPIRY", "60"))
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Per-request deadlines (seconds); pool is how long a request may wait for a free connection
+SUPABASE_QUERY_TIMEOUT = httpx.Timeout(float(os.environ.get("SUPABASE_QUERY_TIMEOUT", "10")), connect=5, pool=5)
+SUPABASE_STORAGE_TIMEOUT = httpx.Timeout(float(os.environ.get("SUPABASE_STORAGE_TIMEOUT", "60")), connect=5, pool=5)
 
-def upload_to_storage(bucket_name: str, file_path: str, file_content: bytes, content_type: str = None):
+
+class MeteredTransport(httpx.AsyncHTTPTransport):
+    """
+    HTTP/2 keep-alive transport that counts requests in flight, to show how close the pool
+    is to saturation
+    """
+
+    def __init__(self, max_connections: int, max_keepalive: int, keepalive_expiry: float):
+        super().__init__(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry
+            )
+        )
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        # Requests that arrived while every connection was already busy
+        self.saturated = 0
+        self.pool_timeouts = 0
+
+    async def handle_async_request(self, request):
+        self.requests += 1
+        if self.in_flight >= self.max_connections:
+            self.saturated += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await super().handle_async_request(request)
+        except httpx.PoolTimeout:
+            self.pool_timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def stats(self):
+        return {
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "saturated": self.saturated,
+            "pool_timeouts": self.pool_timeouts
+        }
+
+
+def _new_transport():
+    return MeteredTransport(SUPABASE_MAX_CONNECTIONS, SUPABASE_MAX_KEEPALIVE, SUPABASE_KEEPALIVE_EXPIRY)
+
+
+postgrest_transport = _new_transport()
+storage_transport = _new_transport()
+
+
+class PooledPostgrestClient(AsyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=SUPABASE_QUERY_TIMEOUT,
+            follow_redirects=True,
+            transport=postgrest_transport
+        )
+
+
+class PooledStorageClient(AsyncStorageClient):
+    def _create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=SUPABASE_STORAGE_TIMEOUT,
+            follow_redirects=True,
+            transport=storage_transport
+        )
+
+
+class PooledAsyncClient(AsyncClient):
+    """
+    Async Supabase client whose PostgREST and storage sessions run on the shared metered pools
+    """
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=None, verify=True, proxy=None):
+        return PooledPostgrestClient(rest_url, headers=headers, schema=schema)
+
+    @staticmethod
+    def _init_storage_client(storage_url, headers, storage_client_timeout=None, verify=True, proxy=None):
+        return PooledStorageClient(storage_url, headers)
+
+
+class SupabaseConnection:
+    """
+    The backend's shared async Supabase client
+
+    connect() and close() are called from the FastAPI lifespan; in between, table() and
+    storage can be used from any handler and every call is awaited on the shared pools.
+    """
+
+    def __init__(self):
+        self.client: AsyncClient = None
+
+    async def connect(self):
+        if self.client is None:
+            self.client = await PooledAsyncClient.create(SUPABASE_URL, SUPABASE_KEY, AsyncClientOptions())
+        return self.client
+
+    async def close(self):
+        await postgrest_transport.aclose()
+        await storage_transport.aclose()
+        self.client = None
+
+    def table(self, table_name: str):
+        return self.client.table(table_name)
+
+    @property
+    def storage(self):
+        return self.client.storage
+
+    def stats(self):
+        """
+        Get the connection pools' usage
+        """
+        return {
+            "postgrest": postgrest_transport.stats(),
+            "storage": storage_transport.stats()
+        }
+
+
+supabase = SupabaseConnection()
+
+# Buckets known to exist, so concurrent uploads don't each look the bucket up
+_known_buckets = set()
+
+async def ensure_bucket(bucket_name: str):
+    """
+    Create a Supabase Storage bucket if it doesn't exist yet.
+
+    :param bucket_name: The name of the bucket
+    """
+    if bucket_name in _known_buckets:
+        return
+    try:
+        await supabase.storage.get_bucket(bucket_name)
+    except StorageApiError as e:
+        # Anything but a missing bucket (bad credentials, permissions) is a real error
+        if "not found" not in str(e.message).lower():
+            raise
+        try:
+            await supabase.storage.create_bucket(bucket_name)
+        except StorageApiError as e:
+            # A concurrent upload may have just created it
+            if "already exists" not in str(e.message).lower():
+                raise
+    _known_buckets.add(bucket_name)
+
+async def upload_to_storage(bucket_name: str, file_path: str, file_content: bytes, content_type: str = None):
     """
     Upload a file to Supabase Storage.
-    
+
     :param bucket_name: The name of the bucket to upload to
     :param file_path: The path to store the file at in the bucket
     :param file_content: The binary content of the file
@@ -23,28 +189,57 @@ def upload_to_storage(bucket_name: str, file_path: str, file_content: bytes, con
     :return: The response from Supabase Storage
     """
     # Create the bucket if it doesn't exist
-    try:
-        supabase.storage.get_bucket(bucket_name)
-    except:
-        supabase.storage.create_bucket(bucket_name)
-    
+    await ensure_bucket(bucket_name)
+
     # Upload the file
     options = {"content-type": content_type} if content_type else None
-    response = supabase.storage.from_(bucket_name).upload(
+    response = await supabase.storage.from_(bucket_name).upload(
         file_path,
         file_content,
         file_options=options
     )
-    
+
     return response
 
-def get_public_url(bucket_name: str, file_path: str):
+async def stream_to_storage(bucket_name: str, file_path: str, chunks, content_type: str, content_length: int = None):
+    """
+    Upload a file to Supabase Storage from an async iterator of chunks, without holding
+    the whole file in memory.
+
+    storage3's upload() always builds a multipart body from the complete file, so the raw
+    body is streamed to the Storage object endpoint on the pooled storage session instead.
+
+    :param bucket_name: The name of the bucket to upload to
+    :param file_path: The path to store the file at in the bucket
+    :param chunks: Async iterator of the file's bytes
+    :param content_type: The content type of the file
+    :param content_length: The size of the file, if known
+    :return: The response from Supabase Storage
+    """
+    await ensure_bucket(bucket_name)
+
+    headers = {
+        "content-type": content_type,
+        "cache-control": "max-age=3600",
+        "x-upsert": "false"
+    }
+    if content_length is not None:
+        headers["content-length"] = str(content_length)
+
+    response = await supabase.storage.session.post(
+        f"/object/{bucket_name}/{file_path}",
+        content=chunks,
+        headers=headers
+    )
+    response.raise_for_status()
+    return response.json()
+
+async def get_public_url(bucket_name: str, file_path: str):
     """
     Get the public URL for a file in Supabase Storage.
-    
+
     :param bucket_name: The name of the bucket
     :param file_path: The path of the file in the bucket
     :return: The public URL of the file
     """
-    return supabase.storage.from_(bucket_name).get_public_url(file_path)
-
+    return await supabase.storage.from_(bucket_name).get_public_url(file_path)
@@ -0,0 +1,170 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class WebhookQueue:
+    """
+    Durable local queue for inbound webhook payloads, stored in SQLite (WAL mode).
+
+    The webhook handler only has to enqueue() the raw payload, which is a single small
+    insert, and can answer Twilio right away. Workers claim() jobs, process them and then
+    ack() them, or retry() them with exponential backoff. A claimed job that is never acked
+    (say the process died mid-job) becomes claimable again after visibility_timeout seconds,
+    so every payload is processed at least once. Jobs that fail max_attempts times are kept
+    as dead letters instead of being retried forever.
+    """
+
+    def __init__(self, db_path: str = "webhook_queue.db", visibility_timeout: float = 300, max_attempts: int = 5,
+                 base_retry_delay: float = 5, max_retry_delay: float = 600):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.base_retry_delay = base_retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only risks the last transactions on power loss, not corruption
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                available_at REAL NOT NULL,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                dead INTEGER NOT NULL DEFAULT 0,
+                dedupe_key TEXT
+            )
+        """)
+        # Queues created before dedupe keys existed
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if "dedupe_key" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN dedupe_key TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(dead, available_at)")
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe_key ON jobs(dedupe_key)")
+
+    def enqueue(self, payload: dict, dedupe_key: str = None):
+        """
+        Persist a payload and return its job id
+
+        If a job with the same dedupe_key is still in the queue, nothing is added and None
+        is returned.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (payload, enqueued_at, available_at, dedupe_key) VALUES (?, ?, ?, ?)",
+                (json.dumps(payload), now, now, dedupe_key)
+            )
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def claim(self):
+        """
+        Take the oldest job that is ready to run
+
+        Returns a dict with id, payload, attempts and enqueued_at, or None if nothing is ready.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT id, payload, attempts, enqueued_at FROM jobs
+                    WHERE dead = 0 AND available_at <= ? AND (claimed_at IS NULL OR claimed_at <= ?)
+                    ORDER BY id LIMIT 1
+                    """,
+                    (now, now - self.visibility_timeout)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (now, row[0])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return {
+            "id": row[0],
+            "payload": json.loads(row[1]),
+            "attempts": row[2] + 1,
+            "enqueued_at": row[3]
+        }
+
+    def ack(self, job_id: int):
+        """
+        Remove a job that was processed successfully
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def retry(self, job_id: int, error: str = None):
+        """
+        Release a failed job to be retried later, or keep it as a dead letter once it has
+        failed max_attempts times
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            attempts = row[0]
+            if attempts >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE jobs SET dead = 1, claimed_at = NULL, last_error = ? WHERE id = ?",
+                    (error, job_id)
+                )
+                return
+            delay = min(self.max_retry_delay, self.base_retry_delay * 2 ** (attempts - 1))
+            self._conn.execute(
+                "UPDATE jobs SET claimed_at = NULL, available_at = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, error, job_id)
+            )
+
+    def defer(self, job_id: int, delay: float):
+        """
+        Release a claimed job to run again after delay seconds without counting the attempt,
+        for jobs that couldn't run yet rather than failed (e.g. the message is still being
+        processed elsewhere)
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET claimed_at = NULL, available_at = ?, attempts = MAX(attempts - 1, 0) WHERE id = ?",
+                (time.time() + delay, job_id)
+            )
+
+    def stats(self):
+        """
+        Get the queue's depth and lag
+        """
+        now = time.time()
+        with self._lock:
+            pending, in_flight, dead, oldest = self._conn.execute(
+                """
+                SELECT
+                    COALESCE(SUM(dead = 0 AND (claimed_at IS NULL OR claimed_at <= ?)), 0),
+                    COALESCE(SUM(dead = 0 AND claimed_at > ?), 0),
+                    COALESCE(SUM(dead = 1), 0),
+                    MIN(CASE WHEN dead = 0 THEN enqueued_at END)
+                FROM jobs
+                """,
+                (now - self.visibility_timeout, now - self.visibility_timeout)
+            ).fetchone()
+        return {
+            "pending": pending,
+            "in_flight": in_flight,
+            "dead": dead,
+            # How long the oldest unfinished payload has been waiting
+            "lag_seconds": round(now - oldest, 3) if oldest else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,60 @@
+import aiohttp
+from ImageStore.image_processing import MAX_IMAGE_BYTES, sniff_image_type
+
+
+# Bytes needed to recognize every format sniff_image_type knows
+SNIFF_BYTES = 16
+CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentRejected(Exception):
+    """
+    Raised when an attachment is refused; the message is meant for the user
+    """
+
+
+# Created lazily so it binds to the bot's running event loop
+_session = None
+
+
+def _get_session():
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+    return _session
+
+
+async def read_attachment(attachment, max_bytes: int = MAX_IMAGE_BYTES, chunk_size: int = CHUNK_SIZE):
+    """
+    Download a Discord attachment in chunks, refusing it as early as possible
+
+    Attachments larger than max_bytes are refused from their reported size before anything
+    is downloaded, and the download is cut off if more than max_bytes actually arrive. The
+    content type is sniffed from the first bytes, so a file that isn't an image is dropped
+    after its first chunk. Returns the image bytes and their real content type.
+    """
+    limit_mb = max_bytes // (1024 * 1024)
+    if attachment.size > max_bytes:
+        raise AttachmentRejected(f"That image is too large ({attachment.size / (1024 * 1024):.1f} MB). Please send an image under {limit_mb} MB.")
+
+    buffer = bytearray()
+    content_type = None
+    async with _get_session().get(attachment.url) as response:
+        response.raise_for_status()
+        if response.content_length and response.content_length > max_bytes:
+            raise AttachmentRejected(f"That image is too large. Please send an image under {limit_mb} MB.")
+
+        async for chunk in response.content.iter_chunked(chunk_size):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise AttachmentRejected(f"That image is too large. Please send an image under {limit_mb} MB.")
+            if content_type is None and len(buffer) >= SNIFF_BYTES:
+                content_type = sniff_image_type(bytes(buffer[:SNIFF_BYTES]))
+                if content_type is None:
+                    raise AttachmentRejected("That file isn't an image I can read. Please send a photo (JPEG or PNG) of your completed task.")
+
+    if content_type is None:
+        content_type = sniff_image_type(bytes(buffer))
+        if content_type is None:
+            raise AttachmentRejected("That file isn't an image I can read. Please send a photo (JPEG or PNG) of your completed task.")
+    return bytes(buffer), content_type
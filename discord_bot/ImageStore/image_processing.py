@@ -0,0 +1,197 @@
+import base64
+import io
+import os
+from PIL import Image, ImageOps, ImageStat
+
+
+# Low-detail vision requests are processed at 512x512, so anything larger is wasted upload
+VISION_MAX_SIDE = 512
+VISION_JPEG_QUALITY = 80
+
+# Limits for the local pre-check that runs before any upload or OpenAI call
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))  # OpenAI's image size limit
+MAX_IMAGE_PIXELS = 50_000_000
+MIN_IMAGE_SIDE = 64
+# Images whose grayscale thumbnail varies less than this are blank (all black, all white...)
+MIN_PIXEL_STDDEV = 4.0
+MIN_ENTROPY = 1.0
+# Discord's (dark theme) desktop layout: dark server/channel list columns on the left of
+# the message pane. A screenshot must show both, so a photo that is mostly one plain color
+# (a white page, a dark room) doesn't match. (sidebar colors, message pane colors) of the
+# current and the previous dark theme:
+DISCORD_THEMES = [
+    ([(30, 31, 34), (43, 45, 49)], [(49, 51, 56)]),
+    ([(32, 34, 37), (47, 49, 54)], [(54, 57, 63)])
+]
+DISCORD_COLOR_TOLERANCE = 3
+# Share of a column's pixels that must be sidebar color for it to count as sidebar
+DISCORD_SIDEBAR_COLUMN_SHARE = 0.5
+# The sidebar band spans between these shares of the screenshot's width
+DISCORD_SIDEBAR_MIN_WIDTH = 0.05
+DISCORD_SIDEBAR_MAX_WIDTH = 0.45
+# Share of the area right of the sidebar that must be message pane color
+DISCORD_MESSAGE_PANE_SHARE = 0.5
+PRECHECK_SIDE = 64
+# The layout is sampled (nearest neighbor, so flat UI colors aren't blended with text) at this size
+DISCORD_LAYOUT_SIDE = 128
+
+
+def to_data_url(image_data: bytes, content_type: str = "image/png"):
+    """
+    Encode raw image bytes as a base64 data URL
+    """
+    return f"data:{content_type};base64,{base64.b64encode(image_data).decode('ascii')}"
+
+
+def prepare_for_vision(image_data: bytes, content_type: str = None, max_side: int = VISION_MAX_SIDE):
+    """
+    Decode an image once, shrink it to the vision model's low-detail resolution and
+    re-encode it as a compact JPEG data URL that can be sent inline with the request
+
+    If the image can't be decoded, the original bytes are sent as-is.
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            # Let JPEG decode at reduced scale instead of decoding every pixel of the original
+            image.draft('RGB', (max_side * 2, max_side * 2))
+            # Respect the camera orientation so the model sees the photo the right way up
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side))
+
+            # JPEG has no alpha channel; flatten transparent images onto white
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=VISION_JPEG_QUALITY, optimize=True)
+            return to_data_url(output.getvalue(), 'image/jpeg')
+    except Exception as e:
+        print(f"Error preparing image for vision, sending original: {str(e)}")
+        return to_data_url(image_data, content_type or 'image/png')
+
+
+def sniff_image_type(head: bytes):
+    """
+    Get an image's real content type from its first bytes, or None if it isn't a known image format
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'heic', b'heix', b'mif1', b'msf1'):
+        return 'image/heic'
+    if head[:2] == b'BM':
+        return 'image/bmp'
+    return None
+
+
+def _matches_any(pixel, colors):
+    r, g, b = pixel
+    return any(
+        abs(r - cr) <= DISCORD_COLOR_TOLERANCE and abs(g - cg) <= DISCORD_COLOR_TOLERANCE and abs(b - cb) <= DISCORD_COLOR_TOLERANCE
+        for cr, cg, cb in colors
+    )
+
+
+def _has_discord_layout(columns, height, sidebar_colors, pane_colors):
+    # Width of the band of sidebar columns starting at the left edge
+    sidebar = 0
+    for column in columns:
+        if sum(_matches_any(pixel, sidebar_colors) for pixel in column) < height * DISCORD_SIDEBAR_COLUMN_SHARE:
+            break
+        sidebar += 1
+    if not DISCORD_SIDEBAR_MIN_WIDTH * len(columns) <= sidebar <= DISCORD_SIDEBAR_MAX_WIDTH * len(columns):
+        return False
+
+    pane = [pixel for column in columns[sidebar:] for pixel in column]
+    return sum(_matches_any(pixel, pane_colors) for pixel in pane) >= len(pane) * DISCORD_MESSAGE_PANE_SHARE
+
+
+def _looks_like_discord_screenshot(layout):
+    """
+    Check whether an RGB layout sample has Discord's layout: a band of sidebar-colored
+    columns along the left edge, next to a message pane mostly in the pane color
+    """
+    width, height = layout.size
+    pixels = list(layout.getdata())
+    columns = [pixels[x::width] for x in range(width)]
+    return any(_has_discord_layout(columns, height, sidebar, pane) for sidebar, pane in DISCORD_THEMES)
+
+
+def precheck_image(image_data: bytes):
+    """
+    Reject obvious junk before it costs an upload or an OpenAI call
+
+    Checks the file size, that the image decodes, its dimensions, that it isn't blank or
+    nearly featureless, and that it isn't a screenshot of the Discord app itself. Runs on
+    a small thumbnail, so it takes milliseconds. Returns a message for the user explaining
+    why the image was rejected, or None if it looks like a real submission.
+    """
+    if len(image_data) > MAX_IMAGE_BYTES:
+        return f"That image is too large ({len(image_data) / (1024 * 1024):.1f} MB). Please send an image under {MAX_IMAGE_BYTES // (1024 * 1024)} MB."
+
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            width, height = image.size
+            if width * height > MAX_IMAGE_PIXELS:
+                return "That image's resolution is too high. Please send a smaller photo."
+            if min(width, height) < MIN_IMAGE_SIDE:
+                return f"That image is too small ({width}x{height}). Please send a clear photo of your completed task."
+
+            # Let JPEG decode at reduced scale; only small samples are needed
+            image.draft('RGB', (DISCORD_LAYOUT_SIDE * 2, DISCORD_LAYOUT_SIDE * 2))
+            image = image.convert('RGB')
+            scale = DISCORD_LAYOUT_SIDE / max(image.size)
+            layout = image.resize(
+                (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                Image.NEAREST
+            )
+            image.thumbnail((PRECHECK_SIDE, PRECHECK_SIDE))
+            thumbnail = image
+    except Exception as e:
+        print(f"Image failed the decode check: {str(e)}")
+        return "That file couldn't be opened as an image. Please send a photo (JPEG or PNG) of your completed task."
+
+    grayscale = thumbnail.convert('L')
+    if ImageStat.Stat(grayscale).stddev[0] < MIN_PIXEL_STDDEV or grayscale.entropy() < MIN_ENTROPY:
+        return "That image looks blank. Please send a clear photo of your completed task."
+
+    if _looks_like_discord_screenshot(layout):
+        return "That looks like a screenshot of Discord. Please send a photo of your completed task itself."
+
+    return None
+
+
+def dhash(image_data: bytes, hash_size: int = 8):
+    """
+    Compute a 64-bit difference hash of an image
+
+    The image is shrunk to a (hash_size + 1) x hash_size grayscale grid and each bit records
+    whether a pixel is brighter than its right neighbor, so re-encoding, resizing and small
+    edits change only a few bits. Returns None if the image can't be decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            image.draft('L', (hash_size * 8, hash_size * 8))
+            image = ImageOps.exif_transpose(image)
+            pixels = list(image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    except Exception as e:
+        print(f"Error computing image hash: {str(e)}")
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
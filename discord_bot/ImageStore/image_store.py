@@ -1,5 +1,7 @@
 import os
-import supabase
+from supabase import acreate_client, AsyncClient
+from supabase.lib.client_options import AsyncClientOptions
+from ImageStore.phash_index import to_signed64, from_signed64
 from datetime import datetime
 
 
@@ -21,10 +23,31 @@ if it cant find the task, the bot responds saying "You don't have any active tas
 
 class ImageStore:
     def __init__(self):
-        self.supabase = supabase.create_client(
-            os.getenv('SUPABASE_URL'),
-            os.getenv('SUPABASE_KEY')
-        )
+        # The async client is created in connect(), which must run inside the event loop
+        self.supabase: AsyncClient = None
+        # Per-request deadlines (seconds) so one slow PostgREST/storage call can't stall a handler
+        self.query_timeout = float(os.getenv('SUPABASE_QUERY_TIMEOUT', '10'))
+        self.storage_timeout = float(os.getenv('SUPABASE_STORAGE_TIMEOUT', '30'))
+
+    async def connect(self):
+        """
+        Create the shared async Supabase client
+
+        The client keeps a single PostgREST session (httpx, HTTP/2, keep-alive) and a single
+        storage session for its whole lifetime, so every coroutine in the bot multiplexes its
+        queries over the same pooled connections instead of blocking the event loop.
+        Safe to call more than once.
+        """
+        if self.supabase is None:
+            self.supabase = await acreate_client(
+                os.getenv('SUPABASE_URL'),
+                os.getenv('SUPABASE_KEY'),
+                options=AsyncClientOptions(
+                    postgrest_client_timeout=self.query_timeout,
+                    storage_client_timeout=self.storage_timeout
+                )
+            )
+        return self.supabase
 
     async def store_message(self, user_id: str, username: str = None, message_content: str = "", has_image: bool = False, image_url: str = None, task_id: str = None):
         """
@@ -40,20 +63,20 @@ class ImageStore:
                 'status': 'pending'
             }
             
-            result = self.supabase.table('feed').insert(data).execute()
+            result = await self.supabase.table('feed').insert(data).execute()
             return result.data
         except Exception as e:
             print(f"Error storing message in Supabase: {str(e)}")
             return None
 
-    async def store_image(self, image_data: bytes, filename: str):
+    async def store_image(self, image_data: bytes, filename: str, content_type: str = "image/png"):
         """
-        Store an image in Supabase storage
+        Store an image in Supabase storage under its real content type
         """
         try:
             # First, check if the bucket exists by listing files
             try:
-                self.supabase.storage.from_('notes').list()
+                await self.supabase.storage.from_('notes').list()
             except Exception as e:
                 print(f"Error accessing notes bucket: {str(e)}")
                 print("Attempting to create or access the bucket differently...")
@@ -61,7 +84,7 @@ class ImageStore:
                 # Try to create the bucket if it doesn't exist
                 try:
                     # This might not work depending on permissions, but worth a try
-                    self.supabase.storage.create_bucket('notes', {'public': True})
+                    await self.supabase.storage.create_bucket('notes', {'public': True})
                     print("Created notes bucket successfully")
                 except Exception as create_error:
                     print(f"Could not create notes bucket: {str(create_error)}")
@@ -70,14 +93,14 @@ class ImageStore:
                     return "https://placeholder.com/image-not-stored"
             
             # Store the image in the notes bucket
-            result = self.supabase.storage.from_('notes').upload(
+            result = await self.supabase.storage.from_('notes').upload(
                 path=filename,
                 file=image_data,
-                file_options={"content-type": "image/png"}
+                file_options={"content-type": content_type}
             )
             
             # Get the public URL for the uploaded image
-            image_url = self.supabase.storage.from_('notes').get_public_url(filename)
+            image_url = await self.supabase.storage.from_('notes').get_public_url(filename)
             return image_url
         except Exception as e:
             print(f"Error storing image in Supabase: {str(e)}")
@@ -89,7 +112,7 @@ class ImageStore:
         Retrieve messages for a specific user from the feed table
         """
         try:
-            result = self.supabase.table('feed')\
+            result = await self.supabase.table('feed')\
                 .select('*')\
                 .eq('user_id', user_id)\
                 .order('timestamp', desc=True)\
@@ -106,7 +129,7 @@ class ImageStore:
         """
         try:
             # Get the user by discord_user_id
-            user_result = self.supabase.table('users').select('*').eq('discord_user_id', discord_user_id).execute()
+            user_result = await self.supabase.table('users').select('*').eq('discord_user_id', discord_user_id).execute()
             
             # Check if user exists
             if not user_result.data or len(user_result.data) == 0:
@@ -116,7 +139,7 @@ class ImageStore:
             user_id = user_result.data[0]['id'] 
             
             # Get tasks for the user
-            task_result = self.supabase.table('tasks').select('*').eq('user_id', user_id).execute()
+            task_result = await self.supabase.table('tasks').select('*').eq('user_id', user_id).execute()
             return task_result.data
         except Exception as e:
             print(f"Error retrieving task from Supabase: {str(e)}")
@@ -130,7 +153,7 @@ class ImageStore:
         """
         try:
             # First, get the user by discord_user_id
-            user_result = self.supabase.table('users').select('*').eq('discord_user_id', discord_user_id).execute()
+            user_result = await self.supabase.table('users').select('*').eq('discord_user_id', discord_user_id).execute()
             
             # Check if user exists
             if not user_result.data or len(user_result.data) == 0:
@@ -140,7 +163,7 @@ class ImageStore:
             user_id = user_result.data[0]['id']
             
             # Get tasks for the user
-            task_result = self.supabase.table('tasks')\
+            task_result = await self.supabase.table('tasks')\
                 .select('*')\
                 .eq('user_id', user_id)\
                 .order('due_time', desc=True)\
@@ -169,7 +192,7 @@ class ImageStore:
             # if completion is not None:
             #     data['completion_score'] = completion
 
-            result = self.supabase.table('tasks')\
+            result = await self.supabase.table('tasks')\
                 .update(data)\
                 .eq('id', task_id)\
                 .execute()
@@ -178,13 +201,79 @@ class ImageStore:
             print(f"Error updating task status in Supabase: {str(e)}")
             return None
         
+    async def fail_tasks(self, task_ids):
+        """
+        Mark several pending tasks as failed in a single statement
+
+        Only rows that are still pending are changed, so a task completed in the meantime
+        is left alone. Returns the ids of the tasks that were actually marked as failed.
+        Errors are raised, so the caller can retry the same tasks later.
+        """
+        if not task_ids:
+            return []
+        result = await self.supabase.table('tasks')\
+            .update({'status': 'failed'})\
+            .in_('id', list(task_ids))\
+            .eq('status', 'pending')\
+            .execute()
+        return [row['id'] for row in result.data or []]
+
+    async def store_image_hashes(self, entries):
+        """
+        Store the perceptual hashes of a submission's images in the image_hashes table in one insert
+
+        Each entry is a dict with dhash, task_id, user_id and optionally feed_id and image_url.
+        """
+        if not entries:
+            return []
+        try:
+            result = await self.supabase.table('image_hashes').insert([
+                {
+                    'dhash': to_signed64(entry['dhash']),
+                    'task_id': entry['task_id'],
+                    'user_id': entry['user_id'],
+                    'feed_id': entry.get('feed_id'),
+                    'image_url': entry.get('image_url')
+                }
+                for entry in entries
+            ]).execute()
+            return result.data
+        except Exception as e:
+            print(f"Error storing image hashes in Supabase: {str(e)}")
+            return None
+
+    async def load_image_hashes(self, page_size: int = 1000):
+        """
+        Read every stored perceptual hash, page by page
+
+        Yields dicts with the unsigned dhash, task_id, user_id, feed_id and image_url.
+        """
+        last_id = 0
+        while True:
+            try:
+                result = await self.supabase.table('image_hashes')\
+                    .select('id, dhash, task_id, user_id, feed_id, image_url')\
+                    .gt('id', last_id)\
+                    .order('id')\
+                    .limit(page_size)\
+                    .execute()
+            except Exception as e:
+                print(f"Error loading image hashes from Supabase: {str(e)}")
+                return
+            for row in result.data or []:
+                row['dhash'] = from_signed64(row['dhash'])
+                yield row
+            if not result.data or len(result.data) < page_size:
+                return
+            last_id = result.data[-1]['id']
+
     async def check_image_exists(self, filename: str):
         """
         Check if an image exists in the notes storage bucket
         """
         try:
             # Try to list files in the bucket to see if the file exists
-            files = self.supabase.storage.from_('notes').list()
+            files = await self.supabase.storage.from_('notes').list()
             
             # Check if the filename is in the list of files
             for file in files:
@@ -209,7 +298,7 @@ class ImageStore:
         """
         try:
             # First, check the task status
-            task_result = self.supabase.table('tasks')\
+            task_result = await self.supabase.table('tasks')\
                 .select('status')\
                 .eq('id', task_id)\
                 .execute()
@@ -221,7 +310,7 @@ class ImageStore:
             
             # If the task is not completed, check if there's a feed entry with an image_url
             # but return False to allow another submission
-            feed_result = self.supabase.table('feed')\
+            feed_result = await self.supabase.table('feed')\
                 .select('image_url, status')\
                 .eq('task_id', task_id)\
                 .not_.is_('image_url', 'null')\
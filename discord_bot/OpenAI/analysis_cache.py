@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class AnalysisCache:
+    """
+    Bounded cache of image analysis results keyed by the SHA-256 of the image bytes plus the prompt.
+
+    Lookups hit an in-memory LRU first and, when db_path is set, a SQLite table on disk that
+    survives restarts. Disk reads and writes run in a worker thread so they never block the
+    event loop. Values must be JSON-serializable.
+    """
+
+    def __init__(self, max_entries=512, db_path=None, max_disk_entries=50000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis_cache "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.commit()
+            except Exception as e:
+                print(f"Error opening analysis cache database, using memory only: {str(e)}")
+                self._db = None
+
+    @staticmethod
+    def make_key(image_data, prompt):
+        """
+        Build the cache key for an image (or a list of images) and the prompt it was analyzed with
+        """
+        if not isinstance(image_data, (bytes, bytearray)) and len(image_data) == 1:
+            image_data = image_data[0]
+        if isinstance(image_data, (bytes, bytearray)):
+            digest = hashlib.sha256(image_data)
+        else:
+            digest = hashlib.sha256()
+            for image in image_data:
+                digest.update(hashlib.sha256(image).digest())
+        digest.update(b'\0')
+        digest.update(prompt.encode('utf-8'))
+        return digest.hexdigest()
+
+    async def get(self, key):
+        """
+        Get a cached result, or None on a miss
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        if self._db is not None:
+            try:
+                row = await asyncio.to_thread(self._read, key)
+                if row:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.disk_hits += 1
+                    return value
+            except Exception as e:
+                print(f"Error reading analysis cache: {str(e)}")
+
+        self.misses += 1
+        return None
+
+    async def put(self, key, value):
+        """
+        Store a result in memory and, if configured, on disk
+        """
+        self._remember(key, value)
+
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._write, key, json.dumps(value))
+            except Exception as e:
+                print(f"Error writing analysis cache: {str(e)}")
+
+    def _read(self, key):
+        with self._db_lock:
+            return self._db.execute("SELECT value FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+
+    def _write(self, key, value_json):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value_json, time.time())
+            )
+            self._disk_writes += 1
+            # Trim the oldest rows now and then so the disk tier stays bounded too
+            if self._disk_writes % 100 == 0:
+                self._db.execute(
+                    "DELETE FROM analysis_cache WHERE key IN "
+                    "(SELECT key FROM analysis_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+            self._db.commit()
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Get hit/miss counters for display
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'disk_enabled': self._db is not None
+        }
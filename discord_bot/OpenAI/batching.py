@@ -0,0 +1,176 @@
+import asyncio
+import json
+
+
+# JSON schema for one structured request that answers several generation requests at once
+BATCH_REPLY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "replies": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "text": {"type": "string"}
+                },
+                "required": ["id", "text"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["replies"],
+    "additionalProperties": False
+}
+
+
+class GenerationBatcher:
+    """
+    Micro-batches short text-generation requests (reminders, past-due and failure notices).
+
+    Requests that arrive within window seconds of each other are collected and sent as one
+    multi-item structured request (mode 'structured'), or as a bounded parallel fan-out
+    (mode 'parallel'). Each caller awaits only its own reply, so many deadlines landing on
+    the same minute cost a handful of API requests instead of one per task.
+    """
+
+    def __init__(self, complete, model="gpt-4o-mini", window=0.05, max_batch=8, max_parallel=4, mode="structured"):
+        self._complete = complete  # async (call_type=..., **chat completion kwargs) -> response
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self.max_parallel = max_parallel
+        self.mode = mode
+        self._pending = []
+        self._flush_task = None
+        self._running = set()  # Strong references to in-flight flushes
+        self._parallel_slots = None
+        self.items = 0
+        self.batches = 0
+        self.api_requests = 0
+
+    async def generate(self, system_prompt, user_prompt, max_tokens=150):
+        """
+        Queue a generation request and wait for its reply text
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((system_prompt, user_prompt, max_tokens, future))
+        self.items += 1
+
+        if len(self._pending) >= self.max_batch:
+            # A full batch goes out right away
+            batch, self._pending = self._pending, []
+            self._spawn(self._flush(batch))
+        elif self._flush_task is None:
+            self._flush_task = self._spawn(self._flush_later())
+
+        return await future
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        batch, self._pending = self._pending, []
+        await self._flush(batch)
+
+    async def _flush(self, batch):
+        if not batch:
+            return
+        self.batches += 1
+
+        remaining = batch
+        if len(batch) > 1 and self.mode == "structured":
+            try:
+                remaining = await self._run_structured(batch)
+            except Exception as e:
+                print(f"Error in batched generation, falling back to individual requests: {str(e)}")
+                remaining = batch
+
+        await self._run_parallel(remaining)
+
+    async def _run_structured(self, batch):
+        """
+        Answer every request of the batch with one structured request
+
+        Returns the requests that didn't get a reply, to be retried individually.
+        """
+        sections = []
+        for i, (system_prompt, user_prompt, max_tokens, _) in enumerate(batch):
+            sections.append(
+                f"### Request {i}\n"
+                f"Instructions:\n{system_prompt}\n\n"
+                f"User message:\n{user_prompt}\n\n"
+                f"Keep the reply under {max_tokens} tokens."
+            )
+
+        self.api_requests += 1
+        response = await self._complete(
+            call_type='batch',
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "You write several independent messages. For each numbered request, follow its instructions exactly as if they were your only system prompt and reply to its user message. Never mix content between requests. Return one reply per request, using the request's number as its id."},
+                {"role": "user", "content": "\n\n".join(sections)}
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "batch_replies", "strict": True, "schema": BATCH_REPLY_SCHEMA}
+            },
+            max_tokens=min(4000, sum(item[2] for item in batch) + 50 * len(batch))
+        )
+
+        replies = json.loads(response.choices[0].message.content)['replies']
+        by_id = {reply['id']: reply['text'].strip() for reply in replies if reply.get('text', '').strip()}
+
+        missing = []
+        for i, item in enumerate(batch):
+            future = item[3]
+            if i in by_id:
+                if not future.done():
+                    future.set_result(by_id[i])
+            else:
+                missing.append(item)
+        return missing
+
+    async def _run_parallel(self, batch):
+        """
+        Answer requests individually, at most max_parallel at a time
+        """
+        if self._parallel_slots is None:
+            self._parallel_slots = asyncio.Semaphore(self.max_parallel)
+
+        async def _run_one(system_prompt, user_prompt, max_tokens, future):
+            try:
+                async with self._parallel_slots:
+                    self.api_requests += 1
+                    response = await self._complete(
+                        call_type='reminder',
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        max_tokens=max_tokens
+                    )
+                if not future.done():
+                    future.set_result(response.choices[0].message.content.strip())
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+
+        await asyncio.gather(*(_run_one(*item) for item in batch))
+
+    def stats(self):
+        """
+        Get batching counters for display
+        """
+        return {
+            'items': self.items,
+            'batches': self.batches,
+            'api_requests': self.api_requests,
+            'mode': self.mode
+        }
@@ -0,0 +1,98 @@
+import sys
+import time
+from collections import OrderedDict, deque
+
+
+class ConversationStore:
+    """
+    Fixed-capacity store of recent generated messages per task.
+
+    Each task keeps a ring buffer of its last max_messages messages. Tasks are kept in LRU
+    order and evicted when they haven't been touched for ttl_seconds, when more than
+    max_tasks are stored, or when the stored text exceeds max_bytes. Memory stays flat no
+    matter how many tasks the bot reminds about, even if a sequence never cleans up after itself.
+    """
+
+    def __init__(self, max_tasks=1000, max_messages=5, ttl_seconds=6 * 3600, max_bytes=2 * 1024 * 1024):
+        self.max_tasks = max_tasks
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._tasks = OrderedDict()  # task_id -> (deque of messages, last touched)
+        self._bytes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _message_size(message):
+        return sys.getsizeof(message)
+
+    def _touch(self, task_id):
+        messages, _ = self._tasks[task_id]
+        self._tasks[task_id] = (messages, time.monotonic())
+        self._tasks.move_to_end(task_id)
+        return messages
+
+    def _drop(self, task_id):
+        messages, _ = self._tasks.pop(task_id)
+        self._bytes -= sum(self._message_size(m) for m in messages)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._tasks:
+            oldest_id, (_, touched) = next(iter(self._tasks.items()))
+            expired = now - touched > self.ttl_seconds
+            if not (expired or len(self._tasks) > self.max_tasks or self._bytes > self.max_bytes):
+                break
+            self._drop(oldest_id)
+            self.evictions += 1
+
+    def append(self, task_id, message):
+        """
+        Add a message to a task's history, dropping its oldest message when the buffer is full
+        """
+        if task_id not in self._tasks:
+            self._tasks[task_id] = (deque(), time.monotonic())
+        messages = self._touch(task_id)
+
+        if len(messages) >= self.max_messages:
+            self._bytes -= self._message_size(messages.popleft())
+        messages.append(message)
+        self._bytes += self._message_size(message)
+
+        self._evict()
+
+    def get(self, task_id):
+        """
+        Get a task's recent messages, oldest first
+        """
+        self._evict()
+        if task_id not in self._tasks:
+            return []
+        return list(self._touch(task_id))
+
+    def clear(self, task_id):
+        """
+        Forget a task's history
+        """
+        if task_id in self._tasks:
+            self._drop(task_id)
+
+    def __contains__(self, task_id):
+        return task_id in self._tasks
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def size_bytes(self):
+        return self._bytes
+
+    def stats(self):
+        """
+        Get the store's size for display
+        """
+        return {
+            'tasks': len(self._tasks),
+            'messages': sum(len(messages) for messages, _ in self._tasks.values()),
+            'bytes': self._bytes,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,136 @@
+import asyncio
+import random
+import time
+from collections import deque
+import openai
+
+
+# Errors worth trying again: timeouts, dropped connections, rate limits and 5xx responses
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+
+class RequestExecutor:
+    """
+    Runs OpenAI requests with retries and hedging to cut tail latency.
+
+    - Retryable errors are retried up to max_retries times with full-jitter exponential
+      backoff, as long as the overall deadline leaves room for another attempt
+    - When an attempt is still running after the hedge_percentile latency of recent
+      requests with the same key (call type and model), a second identical request is
+      fired and whichever answers first wins; the other is cancelled
+    - Hedges are capped at max_hedge_rate of all requests so a slow OpenAI doesn't get
+      twice the traffic
+    """
+
+    def __init__(self, max_retries=2, base_delay=0.5, max_delay=8.0, hedge_percentile=0.95,
+                 max_hedge_rate=0.05, min_samples=20, window=200):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_percentile = hedge_percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self.window = window
+        self._latencies = {}  # key -> recent successful attempt latencies
+        self.requests = 0
+        self.retries = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+
+    def _record_latency(self, key, latency):
+        self._latencies.setdefault(key, deque(maxlen=self.window)).append(latency)
+
+    def hedge_delay(self, key):
+        """
+        Get how long to wait before hedging a request, or None if there isn't enough history yet
+        """
+        latencies = self._latencies.get(key)
+        if not latencies or len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))]
+
+    def _may_hedge(self):
+        return self.hedges_issued < self.max_hedge_rate * self.requests
+
+    async def run(self, attempt, deadline, key=None):
+        """
+        Run attempt(remaining_seconds) until it succeeds, a non-retryable error is raised,
+        the retries run out or the deadline passes
+        """
+        self.requests += 1
+        started = time.monotonic()
+        retry = 0
+        while True:
+            remaining = deadline - (time.monotonic() - started)
+            try:
+                return await self._run_hedged(attempt, remaining, key)
+            except RETRYABLE_ERRORS as e:
+                if retry >= self.max_retries:
+                    raise
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+                # Don't start an attempt that can't finish before the deadline
+                if deadline - (time.monotonic() - started) - backoff <= 1:
+                    raise
+                retry += 1
+                self.retries += 1
+                print(f"Retrying OpenAI request in {backoff:.1f}s after {type(e).__name__} (retry {retry}/{self.max_retries})")
+                await asyncio.sleep(backoff)
+
+    async def _run_hedged(self, attempt, remaining, key):
+        async def _timed():
+            attempt_started = time.monotonic()
+            result = await attempt(remaining - (attempt_started - hedge_started))
+            self._record_latency(key, time.monotonic() - attempt_started)
+            return result
+
+        hedge_started = time.monotonic()
+        delay = self.hedge_delay(key)
+        if delay is None or delay >= remaining:
+            return await _timed()
+
+        primary = asyncio.ensure_future(_timed())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self._may_hedge():
+                return await primary
+
+            self.hedges_issued += 1
+            hedge = asyncio.ensure_future(_timed())
+            pending.add(hedge)
+
+            # Take the first successful answer; only fail once both attempts have failed
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                        return task.result()
+                    # Prefer reporting the primary's error
+                    if error is None or task is primary:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        """
+        Get retry and hedging counters for display
+        """
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'hedges_issued': self.hedges_issued,
+            'hedges_won': self.hedges_won,
+            'hedge_rate': self.hedges_issued / self.requests if self.requests else 0.0
+        }
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import deque
+
+
+class LLMUnavailable(Exception):
+    """
+    Raised instead of calling OpenAI when the budget is exhausted or the circuit breaker is open
+    """
+
+
+class TokenBucket:
+    """
+    Continuously refilling budget of `capacity` units per minute
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    def available(self, amount=1):
+        self._refill()
+        return self.tokens >= amount
+
+    def take(self, amount=1):
+        self._refill()
+        self.tokens -= amount
+
+    def seconds_until(self, amount=1):
+        self._refill()
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) * 60 / self.capacity
+
+
+class LLMGovernor:
+    """
+    Budget and health gate in front of every OpenAI call.
+
+    - Requests-per-minute and tokens-per-minute budgets (token buckets)
+    - A circuit breaker that opens after consecutive errors or slow responses, rejects calls
+      for open_seconds, then lets a single probe through before closing again
+    - Per-user submission rate limits
+
+    Callers that are rejected get LLMUnavailable immediately instead of waiting on a timeout.
+    """
+
+    def __init__(self, requests_per_minute=300, tokens_per_minute=150000, failure_threshold=5,
+                 latency_threshold=20.0, open_seconds=30.0, submissions_per_user=5, submission_window=60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.open_seconds = open_seconds
+        self.submissions_per_user = submissions_per_user
+        self.submission_window = submission_window
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._user_submissions = {}  # user_id -> deque of submission times
+        self.rejected = 0
+        self.breaker_trips = 0
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.open_seconds:
+            return 'open'
+        return 'half_open'
+
+    def available(self, estimated_tokens=1):
+        """
+        Check whether a call of this size would be let through right now
+        """
+        state = self.state
+        if state == 'open' or (state == 'half_open' and self._probe_in_flight):
+            return False
+        return self.requests.available() and self.tokens.available(estimated_tokens)
+
+    def acquire(self, estimated_tokens):
+        """
+        Reserve budget for one call, or raise LLMUnavailable
+        """
+        if not self.available(estimated_tokens):
+            self.rejected += 1
+            raise LLMUnavailable(f"LLM calls are paused (breaker {self.state}, budget exhausted or probing)")
+
+        if self.state == 'half_open':
+            self._probe_in_flight = True
+        self.requests.take()
+        self.tokens.take(estimated_tokens)
+
+    def record_success(self, latency, estimated_tokens=0, used_tokens=None):
+        """
+        Record a finished call; a response slower than latency_threshold counts as a failure
+        """
+        if used_tokens is not None:
+            # Settle the reservation against what the call actually used
+            self.tokens.take(used_tokens - estimated_tokens)
+
+        if latency >= self.latency_threshold:
+            self.record_failure()
+            return
+
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        """
+        Record a failed call, opening the breaker once failures pile up (or the probe fails)
+        """
+        self._consecutive_failures += 1
+        if self.state == 'half_open' or self._consecutive_failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.breaker_trips += 1
+            self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def release(self):
+        """
+        Record a call that was abandoned before it finished, or that failed for a reason
+        that says nothing about OpenAI's health
+        """
+        self._probe_in_flight = False
+
+    def allow_submission(self, user_id):
+        """
+        Count a submission against the user's rate limit; returns False if it's over the limit
+        """
+        now = time.monotonic()
+        history = self._user_submissions.setdefault(user_id, deque())
+        while history and now - history[0] > self.submission_window:
+            history.popleft()
+        if len(history) >= self.submissions_per_user:
+            return False
+        history.append(now)
+
+        # Forget users whose windows have emptied so the map stays small
+        if len(self._user_submissions) > 10000:
+            self._user_submissions = {uid: h for uid, h in self._user_submissions.items() if h and now - h[-1] <= self.submission_window}
+        return True
+
+    async def wait_until_available(self, estimated_tokens=1, poll_seconds=1.0):
+        """
+        Wait until a call of this size would be let through
+        """
+        while not self.available(estimated_tokens):
+            delay = max(self.requests.seconds_until(), self.tokens.seconds_until(estimated_tokens), poll_seconds)
+            if self._opened_at is not None:
+                delay = max(delay, self.open_seconds - (time.monotonic() - self._opened_at))
+            await asyncio.sleep(min(delay, 30))
+
+    def stats(self):
+        """
+        Get the governor's state for display
+        """
+        return {
+            'state': self.state,
+            'requests_left': int(self.requests.tokens),
+            'tokens_left': int(self.tokens.tokens),
+            'rejected': self.rejected,
+            'breaker_trips': self.breaker_trips
+        }
@@ -1,46 +1,249 @@
+import asyncio
+import httpx
+import json
 import openai
 import os
+import time
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from OpenAI.analysis_cache import AnalysisCache
+from OpenAI.conversation_store import ConversationStore
+from OpenAI.batching import GenerationBatcher
+from OpenAI.governor import LLMGovernor, LLMUnavailable
+from OpenAI.executor import RequestExecutor, RETRYABLE_ERRORS
+from OpenAI import templates
 
 load_dotenv()
 
-# Initialize the OpenAI client
-client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Maximum number of OpenAI requests in flight at once across the whole bot
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '8'))
+# Default deadline (seconds) for one OpenAI call, including time spent waiting for a free slot
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '30'))
 
-def analyze_image(image_url, custom_prompt="Describe the image in detail"):
+# 'single' grades a submission with one structured vision call; 'legacy' uses the
+# analyze_image -> analyze_task_completion -> generate_response pipeline
+SUBMISSION_VERIFY_MODE = os.getenv('SUBMISSION_VERIFY_MODE', 'single')
+
+# Submissions are graded on the fast model first and re-graded on the strong model only
+# when the scores land within GRADING_BORDERLINE_BAND points of the pass thresholds
+GRADING_FAST_MODEL = os.getenv('GRADING_FAST_MODEL', 'gpt-4o-mini')
+GRADING_STRONG_MODEL = os.getenv('GRADING_STRONG_MODEL', 'gpt-4o')
+GRADING_BORDERLINE_BAND = float(os.getenv('GRADING_BORDERLINE_BAND', '15'))
+
+# JSON schema the single-call verdict must follow
+SUBMISSION_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "confidence": {"type": "number", "description": "0-100: how well the submission matches the task"},
+        "completion": {"type": "number", "description": "0-100: how thoroughly the task was done"},
+        "explanation": {"type": "string", "description": "Brief explanation of the scoring"},
+        "reply": {"type": "string", "description": "Message sent back to the user"}
+    },
+    "required": ["confidence", "completion", "explanation", "reply"],
+    "additionalProperties": False
+}
+
+# Initialize the shared async OpenAI client; every call reuses one keep-alive connection pool.
+# Retries are left to the request executor so they share its deadline and backoff.
+client = openai.AsyncOpenAI(
+    api_key=os.getenv('OPENAI_API_KEY'),
+    timeout=OPENAI_TIMEOUT,
+    max_retries=0,
+    http_client=openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONCURRENCY,
+            max_keepalive_connections=OPENAI_MAX_CONCURRENCY
+        )
+    )
+)
+
+# Token standing in for the live time remaining in pre-generated reminders
+TIME_REMAINING_PLACEHOLDER = "[TIME_LEFT]"
+
+# Returned by analyze_image when the image couldn't be analyzed
+ANALYZE_IMAGE_ERROR = "Unable to analyze image due to download or processing error. Please try again later."
+
+# Cache of analysis results keyed by image content, so a resent photo costs no API call
+analysis_cache = AnalysisCache(
+    max_entries=int(os.getenv('ANALYSIS_CACHE_SIZE', '512')),
+    db_path=os.getenv('ANALYSIS_CACHE_DB')
+)
+
+# Budgets and circuit breaker shared by every OpenAI call
+governor = LLMGovernor(
+    requests_per_minute=int(os.getenv('OPENAI_RPM_BUDGET', '300')),
+    tokens_per_minute=int(os.getenv('OPENAI_TPM_BUDGET', '150000')),
+    failure_threshold=int(os.getenv('OPENAI_BREAKER_FAILURES', '5')),
+    latency_threshold=float(os.getenv('OPENAI_BREAKER_LATENCY', '20')),
+    open_seconds=float(os.getenv('OPENAI_BREAKER_OPEN_SECONDS', '30')),
+    submissions_per_user=int(os.getenv('SUBMISSIONS_PER_USER_PER_MINUTE', '5'))
+)
+
+# Retries and hedges for every OpenAI call
+executor = RequestExecutor(
+    max_retries=int(os.getenv('OPENAI_MAX_RETRIES', '2')),
+    hedge_percentile=float(os.getenv('OPENAI_HEDGE_PERCENTILE', '0.95')),
+    max_hedge_rate=float(os.getenv('OPENAI_HEDGE_MAX_RATE', '0.05'))
+)
+
+# Created lazily so it binds to the bot's running event loop
+_request_slots = None
+
+def estimate_tokens(kwargs):
+    """
+    Rough token count of a chat completion request (prompt plus the reply budget)
+    """
+    chars = 0
+    images = 0
+    for message in kwargs.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get('type') == 'text':
+                chars += len(part['text'])
+            elif part.get('type') == 'image_url':
+                images += 1
+    # ~4 characters per token; a low-detail image costs a flat 85 tokens
+    return chars // 4 + images * 85 + kwargs.get('max_tokens', 500)
+
+async def create_chat_completion(deadline=OPENAI_TIMEOUT, call_type='default', **kwargs):
+    """
+    Run a chat completion on the shared client
+
+    Retryable errors are retried with backoff and slow requests are hedged (see
+    RequestExecutor), all within the deadline. Raises LLMUnavailable without calling
+    OpenAI when the governor's budget is spent or its breaker is open.
+
+    call_type names the kind of call ('reminder', 'batch', 'vision', ...); hedging keeps a
+    separate latency history per call type and model, since a short reminder and a vision
+    grading call have very different normal latencies.
+    """
+    return await executor.run(
+        lambda remaining: _send_chat_completion(remaining, kwargs),
+        deadline,
+        key=(call_type, kwargs.get('model'))
+    )
+
+async def _send_chat_completion(deadline, kwargs):
+    """
+    Send one chat completion request
+
+    At most OPENAI_MAX_CONCURRENCY requests run at once; the rest wait for a slot.
+    The deadline covers both the wait and the request itself. The governor only sees the
+    request once it holds a slot, so time spent queued here is neither counted as OpenAI
+    latency nor, if the deadline runs out while queued, as an OpenAI failure.
+    """
+    global _request_slots
+    if _request_slots is None:
+        _request_slots = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+    queued = time.monotonic()
+    await asyncio.wait_for(_request_slots.acquire(), deadline)
+    try:
+        remaining = deadline - (time.monotonic() - queued)
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+
+        estimated = estimate_tokens(kwargs)
+        governor.acquire(estimated)
+
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(client.chat.completions.create(timeout=remaining, **kwargs), remaining)
+        except asyncio.CancelledError:
+            # The caller gave up on the call (or it lost a hedge); that says nothing about OpenAI's health
+            governor.release()
+            raise
+        except RETRYABLE_ERRORS:
+            # Timeouts, connection errors, 429s and 5xx: OpenAI is struggling
+            governor.record_failure()
+            raise
+        except Exception:
+            # Bad requests, auth and content policy errors are ours, not an outage
+            governor.release()
+            raise
+
+        usage = getattr(response, 'usage', None)
+        governor.record_success(time.monotonic() - started, estimated, usage.total_tokens if usage else None)
+        return response
+    finally:
+        _request_slots.release()
+
+def image_parts(image_url):
+    """
+    Build the vision content parts for one image URL or a list of them
+    """
+    image_urls = [image_url] if isinstance(image_url, str) else list(image_url)
+    return [
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": url,
+                "detail": "low"  # Use low detail to speed up processing
+            }
+        }
+        for url in image_urls
+    ]
+
+async def analyze_image(image_url, custom_prompt="Describe the image in detail", deadline=OPENAI_TIMEOUT, image_data=None):
+    """
+    Describe an image, or several images of one submission in a single request
+    
+    image_url and image_data may each be a single value or a list.
+    """
+    # Reuse the previous analysis when the same image bytes were analyzed with the same prompt
+    cache_key = None
+    if image_data:
+        cache_key = AnalysisCache.make_key(image_data, f"analyze_image\0{custom_prompt}")
+        cached = await analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
     try:
-        # Add a timeout for the request to prevent hanging
-        response = client.chat.completions.create(
+        response = await create_chat_completion(
+            call_type='vision',
+            deadline=deadline,
             model="gpt-4o-mini",
             messages=[
                 {
                     "role": "user",
                     "content": [
                         {"type": "text", "text": custom_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_url,
-                                "detail": "low"  # Use low detail to speed up processing
-                            }
-                        }
+                        *image_parts(image_url)
                     ]
                 }
             ],
-            max_tokens=300,
-            timeout=30  # Add a 30-second timeout
+            max_tokens=300
         )
-        return response.choices[0].message.content
+        analysis = response.choices[0].message.content
+        if cache_key:
+            await analysis_cache.put(cache_key, analysis)
+        return analysis
+    except LLMUnavailable:
+        raise
     except Exception as e:
         print(f"Error in analyze_image: {str(e)}")
         # Return a more graceful error message that won't break downstream processing
-        return "Unable to analyze image due to download or processing error. Please try again later."
+        return ANALYZE_IMAGE_ERROR
 
 class OpenAI_Accountability_Partner:
     def __init__(self):
-        self.conversation_history = {}  # Dictionary to store conversation history by task_id
-        self.openai_client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        # Bounded store of recent generated messages by task_id
+        self.conversation_history = ConversationStore(
+            max_tasks=int(os.getenv('CONVERSATION_MAX_TASKS', '1000')),
+            max_messages=int(os.getenv('CONVERSATION_HISTORY_SIZE', '5')),
+            ttl_seconds=int(os.getenv('CONVERSATION_TTL_SECONDS', str(6 * 3600)))
+        )
+        self.openai_client = client
+        # Reminder, past-due and failure messages are micro-batched across tasks
+        self.batcher = GenerationBatcher(
+            create_chat_completion,
+            window=float(os.getenv('LLM_BATCH_WINDOW', '0.05')),
+            max_batch=int(os.getenv('LLM_BATCH_SIZE', '8')),
+            mode=os.getenv('LLM_BATCH_MODE', 'structured')
+        )
         self.tasks = []
         
     def calculate_urgency_level(self, due_date):
@@ -107,29 +310,26 @@ class OpenAI_Accountability_Partner:
         """
         Initialize conversation history for a task
         """
-        if task_id not in self.conversation_history:
-            self.conversation_history[task_id] = []
+        # The store creates a task's history on its first message
+        pass
     
     def clear_conversation(self, task_id):
         """
         Clear conversation history for a task
         """
-        if task_id in self.conversation_history:
-            self.conversation_history[task_id] = []
+        self.conversation_history.clear(task_id)
     
     def add_to_conversation(self, task_id, message):
         """
         Add a message to the conversation history
         """
-        self.initialize_conversation(task_id)
-        self.conversation_history[task_id].append(message)
+        self.conversation_history.append(task_id, message)
     
     def get_conversation_history(self, task_id):
         """
         Get the conversation history for a task
         """
-        self.initialize_conversation(task_id)
-        return self.conversation_history[task_id]
+        return self.conversation_history.get(task_id)
     
     async def generate_reminder_message(self, task_description, time_remaining, urgency_level, due_time_local=None, task_id=None, reminder_count=0):
         """
@@ -168,17 +368,8 @@ class OpenAI_Accountability_Partner:
             # Create the prompt
             prompt = f"{mood_prompt}\n\n{conversation_context}The user has a task: \"{task_description}\"{due_time_str}. They have {time_remaining} left to complete it. Remind them to complete their task with the appropriate level of urgency. Be concise and direct. Use Gordon Ramsay's style of communication."
             
-            # Generate the response
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": f"Please remind me about my task: {task_description}. I have {time_remaining} left."}
-                ],
-                max_tokens=150
-            )
-            
-            message = response.choices[0].message.content.strip()
+            # Generate the response (batched with other generation requests in the same tick)
+            message = await self.batcher.generate(prompt, f"Please remind me about my task: {task_description}. I have {time_remaining} left.", max_tokens=150)
             
             # Add to conversation history if task_id is provided
             if task_id:
@@ -188,7 +379,66 @@ class OpenAI_Accountability_Partner:
             
         except Exception as e:
             print(f"Error generating reminder message: {str(e)}")
-            return f"⏰ Reminder: Your task \"{task_description}\" is due soon! You have {time_remaining} left to complete it."
+            message = templates.reminder_message(task_description, time_remaining, reminder_count)
+            if task_id:
+                self.add_to_conversation(task_id, message)
+            return message
+    
+    def pregenerate_reminder_messages(self, task_description, due_time_local=None, reminder_counts=range(11)):
+        """
+        Start generating every escalation level of a task's reminder sequence concurrently
+        
+        Each message contains the TIME_REMAINING_PLACEHOLDER token, which render_reminder
+        replaces with the live time remaining when the reminder is sent. Returns a dict of
+        reminder_count -> task, so each reminder only waits for its own level; a task
+        resolves to None if its level failed to generate.
+        
+        The first level is generated on its own and the later levels only start once it is
+        done, so the first reminder isn't held up by a batch with every other level in it.
+        """
+        messages = {}
+        first = None
+        for count in reminder_counts:
+            messages[count] = asyncio.create_task(
+                self._pregenerate_reminder_template(task_description, due_time_local, count, after=first)
+            )
+            if first is None:
+                first = messages[count]
+        return messages
+    
+    async def _pregenerate_reminder_template(self, task_description, due_time_local, reminder_count, after=None):
+        if after is not None:
+            await asyncio.wait([after])
+        try:
+            return await self._generate_reminder_template(task_description, due_time_local, reminder_count)
+        except Exception as e:
+            print(f"Error pre-generating reminder #{reminder_count}: {str(e)}")
+            return None
+    
+    async def _generate_reminder_template(self, task_description, due_time_local, reminder_count):
+        mood_prompt = self.get_mood_prompt(None, reminder_count)
+        due_time_str = f" (due at {due_time_local})" if due_time_local else ""
+        
+        prompt = f"""{mood_prompt}
+
+This is reminder {reminder_count + 1} of 11 in a sequence that escalates as the deadline approaches. The user has a task: "{task_description}"{due_time_str}. Remind them to complete their task with the appropriate level of urgency. Be concise and direct. Use Gordon Ramsay's style of communication.
+
+Wherever you mention how much time they have left, write exactly {TIME_REMAINING_PLACEHOLDER} instead of a time; it will be filled in when the message is sent."""
+        
+        # Generate the response (batched with other generation requests in the same tick)
+        template = await self.batcher.generate(prompt, f"Please remind me about my task: {task_description}. I have {TIME_REMAINING_PLACEHOLDER} left.", max_tokens=150)
+        if TIME_REMAINING_PLACEHOLDER not in template:
+            template += f" ({TIME_REMAINING_PLACEHOLDER} left)"
+        return template
+    
+    def render_reminder(self, template, time_remaining, task_id=None):
+        """
+        Fill in the time remaining in a pre-generated reminder and record it in the conversation history
+        """
+        message = template.replace(TIME_REMAINING_PLACEHOLDER, time_remaining)
+        if task_id:
+            self.add_to_conversation(task_id, message)
+        return message
     
     async def generate_urgent_message(self, task_description, time_remaining, due_time_local=None, task_id=None, reminder_count=8):
         """
@@ -216,7 +466,8 @@ class OpenAI_Accountability_Partner:
             prompt = f"{mood_prompt}\n\n{conversation_context}The user has a task: \"{task_description}\"{due_time_str}. They have ONLY {time_remaining} left to complete it! This is EXTREMELY URGENT! Channel Gordon Ramsay at his most frustrated and angry. Use ALL CAPS liberally. Be dramatic about the time pressure. Use Gordon's signature phrases and insults."
             
             # Generate the response
-            response = self.openai_client.chat.completions.create(
+            response = await create_chat_completion(
+                call_type='reminder',
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": prompt},
@@ -265,17 +516,8 @@ Express extreme disappointment and frustration in Gordon Ramsay's signature styl
 
 Include a reminder that they need to submit an IMAGE as proof of their work, even though it's late."""
             
-            # Generate the response
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": f"My task '{task_description}' is past due now. What should I do?"}
-                ],
-                max_tokens=200
-            )
-            
-            message = response.choices[0].message.content.strip()
+            # Generate the response (batched with other generation requests in the same tick)
+            message = await self.batcher.generate(prompt, f"My task '{task_description}' is past due now. What should I do?", max_tokens=200)
             
             # Add to conversation history if task_id is provided
             if task_id:
@@ -285,7 +527,7 @@ Include a reminder that they need to submit an IMAGE as proof of their work, eve
             
         except Exception as e:
             print(f"Error generating past due message: {str(e)}")
-            return f"⚠️ **TASK PAST DUE!** ⚠️\nYour task \"{task_description}\" is now PAST DUE! Submit your proof IMMEDIATELY to avoid it being marked as failed!"
+            return templates.past_due_message(task_description)
 
     async def generate_failure_message(self, task_description, due_date, due_time_local=None, task_id=None):
         """
@@ -315,17 +557,8 @@ Express extreme disappointment in Gordon Ramsay's signature style. Use ALL CAPS
 
 Remind them that they need to use the command "!reset_task <task_id>" if they want to try again."""
             
-            # Generate the response
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": f"My task '{task_description}' has been marked as failed. What should I do now?"}
-                ],
-                max_tokens=200
-            )
-            
-            message = response.choices[0].message.content.strip()
+            # Generate the response (batched with other generation requests in the same tick)
+            message = await self.batcher.generate(prompt, f"My task '{task_description}' has been marked as failed. What should I do now?", max_tokens=200)
             
             # Add to conversation history if task_id is provided
             if task_id:
@@ -335,15 +568,16 @@ Remind them that they need to use the command "!reset_task <task_id>" if they wa
             
         except Exception as e:
             print(f"Error generating failure message: {str(e)}")
-            return f"❌ **TASK FAILED** ❌\nYour task \"{task_description}\" has been marked as FAILED because you did not complete it by the deadline. If you still want to complete this task, use the command: !reset_task <task_id>"
+            return templates.failure_message(task_description)
             
-    async def analyze_task_completion(self, task_description, submitted_notes, image_analysis):
+    async def analyze_task_completion(self, task_description, submitted_notes, image_analysis, model=GRADING_FAST_MODEL):
         """
         Analyze whether the submitted content meets the task criteria
         """
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
+            response = await create_chat_completion(
+                call_type='grading',
+                model=model,
                 messages=[
                     {"role": "system", "content": """You are a strict task completion analyzer. 
                     Evaluate the submitted work against the task requirements and provide:
@@ -369,6 +603,8 @@ Remind them that they need to use the command "!reset_task <task_id>" if they wa
             
             return confidence, completion, explanation
             
+        except LLMUnavailable:
+            raise
         except Exception as e:
             print(f"Error analyzing task completion: {str(e)}")
             return 0, 0, "Error analyzing submission"
@@ -380,13 +616,24 @@ Remind them that they need to use the command "!reset_task <task_id>" if they wa
             urgency_level = self.calculate_urgency_level(due_date)
             mood = self.get_mood_prompt(urgency_level)
             
-            # Analyze task completion
+            # Analyze task completion on the fast model, escalating borderline scores
+            model = GRADING_FAST_MODEL
             confidence, completion, analysis = await self.analyze_task_completion(
-                task_description, submitted_notes, image_analysis
+                task_description, submitted_notes, image_analysis, model=model
             )
+            if self.is_borderline(confidence, completion):
+                print(f"Borderline grade ({confidence}/{completion}), re-grading on {GRADING_STRONG_MODEL}")
+                regraded = await self.analyze_task_completion(
+                    task_description, submitted_notes, image_analysis, model=GRADING_STRONG_MODEL
+                )
+                # Keep the fast grade if the strong model failed
+                if regraded[2] != "Error analyzing submission":
+                    model = GRADING_STRONG_MODEL
+                    confidence, completion, analysis = regraded
             
             # Generate appropriate response
-            response = self.openai_client.chat.completions.create(
+            response = await create_chat_completion(
+                call_type='reply',
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": f"""You are an AI accountability partner. {mood}. 
@@ -409,15 +656,156 @@ Remind them that they need to use the command "!reset_task <task_id>" if they wa
             return {
                 'response': response.choices[0].message.content,
                 'confidence': confidence,
-                'meets_criteria': confidence >= 70 and completion >= 40
+                'meets_criteria': self.meets_criteria(confidence, completion),
+                'model': model
             }
             
+        except LLMUnavailable:
+            raise
         except Exception as e:
             print(f"Error generating response: {str(e)}")
             return {
                 'response': "Error generating response",
                 'confidence': 0,
-                'meets_criteria': False
+                'meets_criteria': False,
+                'model': None
             }
-    
-    
\ No newline at end of file
+
+    def meets_criteria(self, confidence, completion):
+        """
+        A submission passes when it clearly matches the task and was done thoroughly enough
+        """
+        return confidence >= 70 and completion >= 40
+
+    def is_borderline(self, confidence, completion, band=None):
+        """
+        A grade is borderline when moving the scores by up to band points could flip the verdict
+        """
+        band = GRADING_BORDERLINE_BAND if band is None else band
+        return self.meets_criteria(confidence + band, completion + band) != self.meets_criteria(confidence - band, completion - band)
+
+    async def verify_submission(self, task_description, due_date, submitted_notes, image_url, model=GRADING_FAST_MODEL):
+        """
+        Grade a submission with a single vision call that returns a structured verdict
+        
+        The image, the task and the notes go to the model together, and the reply is
+        constrained to SUBMISSION_VERDICT_SCHEMA, so the scores and the user-facing
+        reply come back in one round trip with nothing to parse by hand. image_url may be a
+        list, in which case all the images are graded together for one combined verdict.
+        """
+        urgency_level = self.calculate_urgency_level(due_date)
+        mood = self.get_mood_prompt(urgency_level)
+        
+        response = await create_chat_completion(
+            call_type='vision',
+            model=model,
+            messages=[
+                {"role": "system", "content": f"""You are a strict task completion analyzer and an AI accountability partner. {mood}
+                Evaluate the submitted image and notes against the task requirements and provide:
+                1. confidence: score (0-100) of how well the submission matches the task
+                2. completion: score (0-100) of how thoroughly the task was done
+                3. explanation: brief explanation of your scoring
+                4. reply: a message to the user that acknowledges the submission, comments on its quality
+                   and completeness, gives feedback based on the scores, mentions the deadline with
+                   appropriate urgency and maintains the specified mood"""},
+                {"role": "user", "content": [
+                    {"type": "text", "text": f"""
+                    Task Description: {task_description}
+                    Due: {due_date}
+                    
+                    Submitted Notes: {submitted_notes}
+                    
+                    Analyze the attached submission image(s) and provide your verdict. When there are
+                    several images, they are parts of the same submission; judge them together."""},
+                    *image_parts(image_url)
+                ]}
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "submission_verdict",
+                    "strict": True,
+                    "schema": SUBMISSION_VERDICT_SCHEMA
+                }
+            },
+            max_tokens=500
+        )
+        
+        verdict = json.loads(response.choices[0].message.content)
+        confidence = float(verdict['confidence'])
+        completion = float(verdict['completion'])
+        
+        return {
+            'response': verdict['reply'],
+            'confidence': confidence,
+            'completion': completion,
+            'explanation': verdict['explanation'],
+            'meets_criteria': self.meets_criteria(confidence, completion),
+            'model': model
+        }
+
+    async def evaluate_submission(self, task_description, due_date, submitted_notes, image_url, image_data=None):
+        """
+        Grade an image submission and build the reply for the user
+        
+        Uses the single structured verdict call unless SUBMISSION_VERIFY_MODE is 'legacy',
+        and falls back to the legacy analyze/grade/respond pipeline if that call fails.
+        Either way the grade comes from GRADING_FAST_MODEL unless it is borderline, in which
+        case it is redone on GRADING_STRONG_MODEL; the verdict's 'model' says which one decided.
+        When the image bytes are given, a verdict for the same image and prompt inputs (task,
+        due date and current urgency, notes, mode and models) is served from the analysis cache. image_url and image_data may be lists for a
+        submission made of several images, which still costs a single grading request. Raises LLMUnavailable while the governor is
+        holding calls back, so the caller can queue the submission instead of failing it.
+        """
+        cache_key = None
+        if image_data:
+            # Everything that goes into the grading prompts; the urgency level (and with it
+            # the mood) changes as the due date gets closer
+            prompt_inputs = [
+                "verdict", SUBMISSION_VERIFY_MODE, GRADING_FAST_MODEL, GRADING_STRONG_MODEL,
+                GRADING_BORDERLINE_BAND, task_description, due_date,
+                self.calculate_urgency_level(due_date), submitted_notes
+            ]
+            cache_key = AnalysisCache.make_key(image_data, "\0".join(str(value) for value in prompt_inputs))
+            cached = await analysis_cache.get(cache_key)
+            if cached is not None:
+                print("Using cached verdict for a previously analyzed image")
+                return dict(cached)
+        
+        result = None
+        if SUBMISSION_VERIFY_MODE != 'legacy':
+            try:
+                result = await self.verify_submission(task_description, due_date, submitted_notes, image_url)
+            except LLMUnavailable:
+                raise
+            except Exception as e:
+                print(f"Error verifying submission, falling back to legacy analysis: {str(e)}")
+            
+            if result is not None and self.is_borderline(result['confidence'], result['completion']):
+                print(f"Borderline verdict ({result['confidence']}/{result['completion']}), re-grading on {GRADING_STRONG_MODEL}")
+                try:
+                    result = await self.verify_submission(task_description, due_date, submitted_notes, image_url, model=GRADING_STRONG_MODEL)
+                except Exception as e:
+                    # The fast verdict is still a usable answer
+                    print(f"Error re-grading submission, keeping the fast verdict: {str(e)}")
+        
+        if result is None:
+            image_analysis = await analyze_image(
+                image_url,
+                "Analyze this task submission and describe what work has been done",
+                image_data=image_data
+            )
+            result = await self.generate_response(
+                task_description=task_description,
+                due_date=due_date,
+                submitted_notes=submitted_notes,
+                image_analysis=image_analysis
+            )
+            # Don't cache verdicts built on a failed analysis or a failed generation
+            if image_analysis == ANALYZE_IMAGE_ERROR or result['response'] == "Error generating response":
+                return result
+        
+        if cache_key:
+            await analysis_cache.put(cache_key, result)
+        return dict(result)
+
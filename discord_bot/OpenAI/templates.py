@@ -0,0 +1,39 @@
+"""
+Built-in messages used when OpenAI is unavailable (budget exhausted, circuit breaker open or
+a failed call). Reminders escalate with reminder_count like the AI ones do.
+"""
+
+# One template per reminder_count (0-10), same Gordon Ramsay progression as get_mood_prompt
+REMINDER_TEMPLATES = [
+    "⏰ Hey there! Just a friendly reminder that your task \"{task}\" is due soon. You have {time_remaining} left. You've got this!",
+    "⏰ Reminder: \"{task}\" is due soon. You have {time_remaining} left, so let's get it done.",
+    "⏰ Time is ticking! \"{task}\" still needs doing and you only have {time_remaining} left. Focus!",
+    "⏰ Come on! \"{task}\" is STILL not done. {time_remaining} left. Get moving!",
+    "⚠️ What are you waiting for?! \"{task}\" is due in {time_remaining}. STOP stalling!",
+    "⚠️ Oh come ON, you donkey! \"{task}\" has {time_remaining} left and NOTHING to show for it!",
+    "🔥 WAKE UP! \"{task}\" is due in {time_remaining}! MOVE IT, MOVE IT, MOVE IT!",
+    "🔥 WHAT ARE YOU DOING?! \"{task}\" IS RAW! ONLY {time_remaining} LEFT!",
+    "🚨 THIS IS A DISASTER! \"{task}\" DUE IN {time_remaining} AND STILL NOTHING! SUBMIT YOUR PROOF NOW!",
+    "🚨 UNBELIEVABLE! {time_remaining} LEFT FOR \"{task}\"! GET IT DONE AND SEND THE PHOTO!",
+    "🚨🚨 I HAVE NEVER SEEN ANYTHING LIKE IT! \"{task}\" — {time_remaining} LEFT! SUBMIT. IT. NOW!!!",
+]
+
+PAST_DUE_TEMPLATE = "⚠️ **TASK PAST DUE!** ⚠️\nYour task \"{task}\" is now PAST DUE! Submit your proof IMMEDIATELY to avoid it being marked as failed!"
+
+FAILURE_TEMPLATE = "❌ **TASK FAILED** ❌\nYour task \"{task}\" has been marked as FAILED because you did not complete it by the deadline. If you still want to complete this task, use the command: !reset_task <task_id>"
+
+
+def reminder_message(task_description, time_remaining, reminder_count=0):
+    """
+    Get the built-in reminder for an escalation level
+    """
+    template = REMINDER_TEMPLATES[max(0, min(reminder_count, len(REMINDER_TEMPLATES) - 1))]
+    return template.format(task=task_description, time_remaining=time_remaining)
+
+
+def past_due_message(task_description):
+    return PAST_DUE_TEMPLATE.format(task=task_description)
+
+
+def failure_message(task_description):
+    return FAILURE_TEMPLATE.format(task=task_description)
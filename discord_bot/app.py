@@ -6,9 +6,14 @@ from dotenv import load_dotenv
 import supabase
 import openai
 from ImageStore.image_store import ImageStore
+from ImageStore.image_processing import prepare_for_vision, precheck_image, dhash
+from ImageStore.phash_index import PerceptualHashIndex
+from ImageStore.attachment_reader import read_attachment, AttachmentRejected
 from datetime import datetime, timedelta
-from OpenAI.server_code import analyze_image, OpenAI_Accountability_Partner
+from OpenAI.server_code import OpenAI_Accountability_Partner, analysis_cache, governor, executor
+from OpenAI.governor import LLMUnavailable
 from task_reminder import TaskReminder
+from submission_queue import SubmissionQueue
 from utils import ny_to_utc, utc_to_ny, format_datetime, is_dst_in_eastern_time
 
 
@@ -32,6 +37,14 @@ image_store = ImageStore()
 accountability_partner = OpenAI_Accountability_Partner()
 task_reminder = TaskReminder(bot, image_store, accountability_partner)
 
+# Images beyond this many in one message are ignored, so a submission's memory stays bounded
+MAX_IMAGES_PER_SUBMISSION = int(os.getenv('MAX_IMAGES_PER_SUBMISSION', '4'))
+
+# Perceptual hashes of every stored submission, for catching recycled proof photos.
+# RECYCLED_IMAGE_ACTION is 'reject' (refuse the photo) or 'flag' (warn and grade it anyway)
+image_hash_index = PerceptualHashIndex(max_distance=int(os.getenv('IMAGE_HASH_MAX_DISTANCE', '6')))
+RECYCLED_IMAGE_ACTION = os.getenv('RECYCLED_IMAGE_ACTION', 'reject')
+
 async def initialize_database():
     """
     Initialize the necessary tables in the database if they don't exist
@@ -39,7 +52,7 @@ async def initialize_database():
     try:
         # Check if the feed table exists
         try:
-            image_store.supabase.table('feed').select('*').limit(1).execute()
+            await image_store.supabase.table('feed').select('*').limit(1).execute()
             print("Feed table exists")
         except Exception as e:
             print(f"Feed table doesn't exist or error: {str(e)}")
@@ -57,7 +70,7 @@ async def initialize_database():
         
         # Check if the tasks table exists
         try:
-            image_store.supabase.table('tasks').select('*').limit(1).execute()
+            await image_store.supabase.table('tasks').select('*').limit(1).execute()
             print("Tasks table exists")
         except Exception as e:
             print(f"Tasks table doesn't exist or error: {str(e)}")
@@ -73,7 +86,7 @@ async def initialize_database():
         
         # Check if the users table exists
         try:
-            image_store.supabase.table('users').select('*').limit(1).execute()
+            await image_store.supabase.table('users').select('*').limit(1).execute()
             print("Users table exists")
         except Exception as e:
             print(f"Users table doesn't exist or error: {str(e)}")
@@ -89,7 +102,7 @@ async def initialize_database():
         # Check if the notes bucket exists by trying to list files
         try:
             # Try to list files in the bucket instead of getting bucket info
-            image_store.supabase.storage.from_('notes').list()
+            await image_store.supabase.storage.from_('notes').list()
             print("Notes bucket exists and is accessible")
         except Exception as e:
             print(f"Notes bucket doesn't exist or error: {str(e)}")
@@ -98,6 +111,59 @@ async def initialize_database():
     except Exception as e:
         print(f"Error initializing database: {str(e)}")
 
+async def evaluate_when_available(**kwargs):
+    """
+    Grade a submission, waiting in line while the LLM budget is spent or the circuit breaker is open
+    """
+    while True:
+        try:
+            return await accountability_partner.evaluate_submission(**kwargs)
+        except LLMUnavailable as e:
+            print(f"Submission queued until OpenAI capacity returns: {str(e)}")
+            await governor.wait_until_available()
+
+async def ingest_attachment(attachment):
+    """
+    Download and pre-check one image attachment
+
+    Returns (image bytes, sniffed content type, None), or (None, None, message for the user)
+    if the attachment was refused.
+    """
+    try:
+        image_data, content_type = await read_attachment(attachment)
+    except AttachmentRejected as e:
+        return None, None, str(e)
+    except Exception as e:
+        print(f"Error downloading attachment {attachment.filename}: {str(e)}")
+        return None, None, "I couldn't download that image. Please try sending it again."
+    
+    # Reject unreadable, tiny, blank and screenshot images
+    rejection = await asyncio.to_thread(precheck_image, image_data)
+    if rejection:
+        return None, None, rejection
+    return image_data, content_type, None
+
+async def load_image_hash_index():
+    """
+    Load the stored submission image hashes into the in-memory index
+    """
+    count = 0
+    async for row in image_store.load_image_hashes():
+        image_hash_index.add(row['dhash'], row['task_id'])
+        count += 1
+    print(f"Loaded {count} submission image hashes")
+
+@bot.event
+async def setup_hook():
+    """Runs once inside the event loop before the bot connects to the gateway."""
+    # Create the shared async Supabase client before any event can use it
+    await image_store.connect()
+    
+    # Lookups just find nothing until the index has loaded
+    bot.loop.create_task(load_image_hash_index())
+    
+    submission_queue.start()
+
 @bot.event
 async def on_ready():
     """Event triggered when the bot is ready and connected to Discord."""
@@ -109,8 +175,8 @@ async def on_ready():
     # Initialize the database
     await initialize_database()
     
-    # Start the task reminder background task
-    bot.loop.create_task(task_reminder.check_upcoming_tasks())
+    # Start the task reminder scheduler (no-op if already running after a reconnect)
+    bot.loop.create_task(task_reminder.start())
     print('Task reminder service started!')
 
 @bot.event
@@ -125,182 +191,279 @@ async def on_message(message):
     
     # Check if the message is a DM
     if isinstance(message.channel, discord.DMChannel):
-        discord_user_id = str(message.author.id)
-        username = message.author.name
-        
-        # Get active tasks for the user
-        tasks = await image_store.get_user_tasks(discord_user_id)
-        
         # If the message starts with a command prefix, don't process it as a regular message
         if message.content.startswith('!'):
             return
-            
-        if not tasks:
-            await message.channel.send("You don't have any active tasks or your Discord account is not linked to a Lockdin account.")
-            await message.channel.send("To create a new account, use: `!create_account <username>`")
-            await message.channel.send("To link an existing account, use: `!link <username>`")
-            return
-            
-        # Filter for pending tasks only
-        pending_tasks = [task for task in tasks if task['status'] == 'pending']
         
-        if not pending_tasks:
-            await message.channel.send("You don't have any pending tasks. Use `!create_task` to create a new task.")
+        # Image submissions are handed to the submission queue so the gateway handler returns right away
+        if any(attachment.content_type and attachment.content_type.startswith('image/') for attachment in message.attachments):
+            result = submission_queue.submit(str(message.author.id), message)
+            if result == SubmissionQueue.FULL:
+                await message.channel.send("⏳ I'm handling a lot of submissions right now. Please send your image again in a few minutes.")
+            elif result == SubmissionQueue.REPLACED:
+                await message.channel.send("📥 Got it! I'll review this image instead of the one you sent before it.")
+            else:
+                await message.channel.send("📥 Got your submission! I'll review it in a moment.")
             return
         
-        # Get the first pending task
-        task = pending_tasks[0]
+        await handle_direct_message(message)
+
+async def handle_direct_message(message):
+    """
+    Handle a DM that isn't a command: grade attached images, or record a text update
+
+    Runs on a submission queue worker for image submissions, one message per user at a time.
+    """
+    discord_user_id = str(message.author.id)
+    username = message.author.name
+    
+    # Get active tasks for the user
+    tasks = await image_store.get_user_tasks(discord_user_id)
+    
+    if not tasks:
+        await message.channel.send("You don't have any active tasks or your Discord account is not linked to a Lockdin account.")
+        await message.channel.send("To create a new account, use: `!create_account <username>`")
+        await message.channel.send("To link an existing account, use: `!link <username>`")
+        return
+        
+    # Filter for pending tasks only
+    pending_tasks = [task for task in tasks if task['status'] == 'pending']
+    
+    if not pending_tasks:
+        await message.channel.send("You don't have any pending tasks. Use `!create_task` to create a new task.")
+        return
+    
+    # Get the first pending task
+    task = pending_tasks[0]
+    
+    # Check if the task already has an image submission
+    has_image = await image_store.check_task_has_image(task['id'])
+    if has_image:
+        await message.channel.send(f"Your task \"{task['description']}\" is already completed. No need for another submission.")
+        await message.channel.send("If you want to create a new task, use: `!create_task <description> | YYYY-MM-DD HH:MM`")
+        return
+
+    # Handle the attached images together as one submission
+    image_attachments = [
+        attachment for attachment in message.attachments
+        if attachment.content_type and attachment.content_type.startswith('image/')
+    ]
+    if image_attachments:
+        # Bound the memory a single submission can take
+        if len(image_attachments) > MAX_IMAGES_PER_SUBMISSION:
+            await message.channel.send(f"⚠️ Only the first {MAX_IMAGES_PER_SUBMISSION} images of a message are reviewed.")
+            image_attachments = image_attachments[:MAX_IMAGES_PER_SUBMISSION]
         
-        # Check if the task already has an image submission
-        has_image = await image_store.check_task_has_image(task['id'])
-        if has_image:
-            await message.channel.send(f"Your task \"{task['description']}\" is already completed. No need for another submission.")
-            await message.channel.send("If you want to create a new task, use: `!create_task <description> | YYYY-MM-DD HH:MM`")
+        # Keep one user from spending the whole analysis budget
+        if not governor.allow_submission(discord_user_id):
+            await message.channel.send("⏳ You're sending submissions too quickly. Please wait a minute and try again.")
             return
-
-        # Handle any attached images
-        if message.attachments:
-            for attachment in message.attachments:
-                if attachment.content_type.startswith('image/'):
-                    try:
-                        # Download the image
-                        image_data = await attachment.read()
-                        # Generate a unique filename using timestamp
-                        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-                        filename = f"{discord_user_id}_{timestamp}_{attachment.filename}"
-                        # Store the image
-                        image_url = await image_store.store_image(image_data, filename)
+        
+        try:
+            # Download and check every image at once; junk is refused before it costs an upload or an OpenAI call
+            ingested = await asyncio.gather(*(ingest_attachment(attachment) for attachment in image_attachments))
+            for attachment, (_, _, rejection) in zip(image_attachments, ingested):
+                if rejection:
+                    prefix = f"{attachment.filename}: " if len(image_attachments) > 1 else ""
+                    await message.channel.send(f"⚠️ {prefix}{rejection}")
+            kept = [i for i, (_, _, rejection) in enumerate(ingested) if not rejection]
+            if not kept:
+                return
+            image_attachments = [image_attachments[i] for i in kept]
+            images = [ingested[i][0] for i in kept]
+            content_types = [ingested[i][1] for i in kept]
+            
+            # Catch proof photos recycled from another task (or another user's submission) without calling OpenAI
+            image_hashes = await asyncio.gather(*(asyncio.to_thread(dhash, image_data) for image_data in images))
+            recycled = None
+            for image_hash in image_hashes:
+                if image_hash is None:
+                    continue
+                recycled = next(
+                    ((distance, task_id) for distance, task_id in image_hash_index.search(image_hash) if task_id != task['id']),
+                    None
+                )
+                if recycled:
+                    break
+            if recycled:
+                recycled_distance, recycled_task_id = recycled
+                print(f"Image for task {task['id']} matches a submission for task {recycled_task_id} (distance {recycled_distance})")
+                if RECYCLED_IMAGE_ACTION == 'reject':
+                    await message.channel.send("⚠️ This photo has already been submitted as proof for another task. Please send a new photo of this task.")
+                    return
+                await message.channel.send("⚠️ This photo looks like one already submitted for another task. It will still be reviewed, but please send an original photo.")
+            
+            # Decode and downsize each image once and send them inline to the vision model,
+            # so OpenAI doesn't have to fetch them back from storage
+            vision_image_urls = await asyncio.gather(*(
+                asyncio.to_thread(prepare_for_vision, image_data, content_type)
+                for image_data, content_type in zip(images, content_types)
+            ))
+            
+            if not governor.available():
+                await message.channel.send("⏳ Our task analyzer is busy right now. Your submission is queued and will be analyzed as soon as capacity returns.")
+            
+            # Grade all the images together in one request while they upload
+            analysis_task = asyncio.create_task(evaluate_when_available(
+                task_description=task['description'],
+                due_date=task['due_time'],
+                submitted_notes=message.content or "",
+                image_url=list(vision_image_urls),
+                image_data=images
+            ))
+            
+            # Store every image at once, under unique filenames built from a timestamp
+            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+            image_urls = await asyncio.gather(*(
+                image_store.store_image(image_data, f"{discord_user_id}_{timestamp}_{index}_{attachment.filename}", content_type)
+                for index, (attachment, image_data, content_type) in enumerate(zip(image_attachments, images, content_types))
+            ))
+            
+            if all(image_urls):
+                # Check if any of them is a placeholder URL due to storage error
+                if any("placeholder.com" in image_url for image_url in image_urls):
+                    await message.channel.send("⚠️ Warning: There was an issue storing your image in our storage system, but we'll continue processing your submission.")
+                
+                # Store a feed entry with image info in Supabase for each image
+                feed_results = await asyncio.gather(*(
+                    image_store.store_message(
+                        user_id=task['user_id'],
+                        username=username,
+                        message_content=message.content or "Task submission",
+                        has_image=True,
+                        image_url=image_url,
+                        task_id=task['id']
+                    )
+                    for image_url in image_urls
+                ))
+                
+                # Remember the photos so they can't be recycled for another task
+                hash_entries = [
+                    {
+                        'dhash': image_hash,
+                        'task_id': task['id'],
+                        'user_id': task['user_id'],
+                        'feed_id': feed_rows[0]['id'] if feed_rows else None,
+                        'image_url': image_url
+                    }
+                    for image_hash, image_url, feed_rows in zip(image_hashes, image_urls, feed_results)
+                    if image_hash is not None
+                ]
+                for hash_entry in hash_entries:
+                    image_hash_index.add(hash_entry['dhash'], hash_entry['task_id'])
+                await image_store.store_image_hashes(hash_entries)
+                
+                # Wait for the combined verdict
+                try:
+                    # Send a "Processing..." message
+                    processing_msg = await message.channel.send("Analyzing your task submission... Please wait.")
+                    
+                    # Wait for the analysis that started before the upload
+                    response_data = await analysis_task
+                    print(f"Task {task['id']} graded by {response_data.get('model')}: confidence {response_data['confidence']}, meets criteria: {response_data['meets_criteria']}")
+                    
+                    # Update task status and scores
+                    if response_data['meets_criteria']:
+                        await image_store.update_task_status(
+                            task['id'],
+                            'completed',
+                            response_data['confidence']
+                        )
+                        task_reminder.publish_status(task['id'], 'completed')
                         
-                        if image_url:
-                            # Check if this is a placeholder URL due to storage error
-                            is_placeholder = "placeholder.com" in image_url
-                            if is_placeholder:
-                                await message.channel.send("⚠️ Warning: There was an issue storing your image in our storage system, but we'll continue processing your submission.")
-                            
-                            # Get the first pending task
-                            task = pending_tasks[0]
-                            
-                            # Store the message with image info in Supabase
-                            await image_store.store_message(
-                                user_id=task['user_id'],
-                                username=username,
-                                message_content=message.content or "Task submission",
-                                has_image=True,
-                                image_url=image_url,
-                                task_id=task['id']
-                            )
-                            
-                            # Analyze the image and generate response
-                            try:
-                                # Send a "Processing..." message
-                                processing_msg = await message.channel.send("Analyzing your task submission... Please wait.")
-                                
-                                # Analyze the image
-                                image_analysis = analyze_image(image_url, "Analyze this task submission and describe what work has been done")
-                                
-                                # Generate accountability response
-                                response_data = await accountability_partner.generate_response(
-                                    task_description=task['description'],
-                                    due_date=task['due_time'],
-                                    submitted_notes=message.content or "",
-                                    image_analysis=image_analysis
-                                )
-                                
-                                # Update task status and scores
-                                if response_data['meets_criteria']:
-                                    await image_store.update_task_status(
-                                        task['id'],
-                                        'completed',
-                                        response_data['confidence']
-                                    )
-                                    
-                                    # Also update the feed entry status
-                                    try:
-                                        image_store.supabase.table('feed')\
-                                            .update({'status': 'completed'})\
-                                            .eq('task_id', task['id'])\
-                                            .execute()
-                                    except Exception as e:
-                                        print(f"Error updating feed status: {str(e)}")
-                                    
-                                    # Award points to the user
-                                    user_result = image_store.supabase.table('users')\
-                                        .select('points')\
-                                        .eq('discord_user_id', discord_user_id)\
-                                        .execute()
-                                    
-                                    if user_result.data and len(user_result.data) > 0:
-                                        current_points = user_result.data[0]['points'] or 0
-                                        new_points = current_points + 25  # Award 25 points for completion
-                                        
-                                        # Update user points
-                                        image_store.supabase.table('users')\
-                                            .update({'points': new_points})\
-                                            .eq('discord_user_id', discord_user_id)\
-                                            .execute()
-                                        
-                                        # Add points info to response
-                                        response_data['response'] += f"\n\n🎉 **Congratulations!** You earned 25 points for completing this task!\nYour new point total is: {new_points} points"
-                                else:
-                                    await image_store.update_task_status(
-                                        task['id'],
-                                        'pending',
-                                        response_data['confidence']
-                                    )
-                                    
-                                    # Add encouragement to response
-                                    response_data['response'] += "\n\nYour submission doesn't fully meet the criteria for this task. Please try again with a more complete submission to earn points."
-                                    
-                                    # Also update the feed entry status to indicate it was unsuccessful
-                                    try:
-                                        image_store.supabase.table('feed')\
-                                            .update({'status': 'unsuccessful'})\
-                                            .eq('task_id', task['id'])\
-                                            .execute()
-                                    except Exception as e:
-                                        print(f"Error updating feed status: {str(e)}")
-                                    
-                                    # Add explicit message about trying again
-                                    await asyncio.sleep(1)  # Wait a second
-                                    await message.channel.send("**You can try again by sending another image that better demonstrates your completed task.**")
-                                
-                                # Delete processing message
-                                await processing_msg.delete()
-                                
-                                # Send the analysis and response
-                                await message.channel.send(response_data['response'])
-                                
-                            except Exception as e:
-                                print(f"Error analyzing submission: {str(e)}")
-                                await message.channel.send("Sorry, there was an error analyzing your submission.")
-                            
+                        # Also update the feed entry status
+                        try:
+                            await image_store.supabase.table('feed')\
+                                .update({'status': 'completed'})\
+                                .eq('task_id', task['id'])\
+                                .execute()
+                        except Exception as e:
+                            print(f"Error updating feed status: {str(e)}")
+                        
+                        # Award points to the user
+                        user_result = await image_store.supabase.table('users')\
+                            .select('points')\
+                            .eq('discord_user_id', discord_user_id)\
+                            .execute()
+                        
+                        if user_result.data and len(user_result.data) > 0:
+                            current_points = user_result.data[0]['points'] or 0
+                            new_points = current_points + 25  # Award 25 points for completion
                             
-                        else:
-                            await message.channel.send("Sorry, there was an error uploading your submission.")
+                            # Update user points
+                            await image_store.supabase.table('users')\
+                                .update({'points': new_points})\
+                                .eq('discord_user_id', discord_user_id)\
+                                .execute()
                             
-                    except Exception as e:
-                        print(f"Error processing submission: {str(e)}")
-                        await message.channel.send("Sorry, there was an error processing your submission.")
+                            # Add points info to response
+                            response_data['response'] += f"\n\n🎉 **Congratulations!** You earned 25 points for completing this task!\nYour new point total is: {new_points} points"
+                    else:
+                        await image_store.update_task_status(
+                            task['id'],
+                            'pending',
+                            response_data['confidence']
+                        )
+                        
+                        # Add encouragement to response
+                        response_data['response'] += "\n\nYour submission doesn't fully meet the criteria for this task. Please try again with a more complete submission to earn points."
+                        
+                        # Also update the feed entry status to indicate it was unsuccessful
+                        try:
+                            await image_store.supabase.table('feed')\
+                                .update({'status': 'unsuccessful'})\
+                                .eq('task_id', task['id'])\
+                                .execute()
+                        except Exception as e:
+                            print(f"Error updating feed status: {str(e)}")
+                        
+                        # Add explicit message about trying again
+                        await asyncio.sleep(1)  # Wait a second
+                        await message.channel.send("**You can try again by sending images that better demonstrate your completed task.**")
                     
-                    break  # Process only the first image for now
-            
-        elif message.content:  # Store text messages without images
-            # Store the message in Supabase
-            if pending_tasks:
-                await image_store.store_message(
-                    user_id=pending_tasks[0]['user_id'],
-                    username=username,
-                    message_content=message.content,
-                    has_image=False,
-                    image_url=None,
-                    task_id=pending_tasks[0]['id']
-                )
+                    # Delete processing message
+                    await processing_msg.delete()
+                    
+                    # Send the analysis and response
+                    await message.channel.send(response_data['response'])
+                    
+                except Exception as e:
+                    print(f"Error analyzing submission: {str(e)}")
+                    await message.channel.send("Sorry, there was an error analyzing your submission.")
+                
                 
-                # Remind the user that they need to submit an image
-                await message.channel.send("I've recorded your message, but remember that you need to submit an image to complete your task and earn points!")
-                await message.channel.send("Please attach an image showing your completed task.")
             else:
-                await message.channel.send("You don't have any pending tasks. Use `!create_task` to create a new task.")
+                analysis_task.cancel()
+                await message.channel.send("Sorry, there was an error uploading your submission.")
+                
+        except Exception as e:
+            print(f"Error processing submission: {str(e)}")
+            await message.channel.send("Sorry, there was an error processing your submission.")
+        
+    elif message.content:  # Store text messages without images
+        # Store the message in Supabase
+        if pending_tasks:
+            await image_store.store_message(
+                user_id=pending_tasks[0]['user_id'],
+                username=username,
+                message_content=message.content,
+                has_image=False,
+                image_url=None,
+                task_id=pending_tasks[0]['id']
+            )
+            
+            # Remind the user that they need to submit an image
+            await message.channel.send("I've recorded your message, but remember that you need to submit an image to complete your task and earn points!")
+            await message.channel.send("Please attach an image showing your completed task.")
+        else:
+            await message.channel.send("You don't have any pending tasks. Use `!create_task` to create a new task.")
+
+# Image submissions are processed off the gateway handler, one at a time per user
+submission_queue = SubmissionQueue(
+    handle_direct_message,
+    workers=int(os.getenv('SUBMISSION_WORKERS', '4')),
+    max_pending=int(os.getenv('SUBMISSION_QUEUE_SIZE', '100'))
+)
 
 # Add a command to manually test the reminder system
 @bot.command(name='testreminder')
@@ -315,7 +478,7 @@ async def test_reminder(ctx, task_id: str = None):
     try:
         if task_id:
             # Get the specific task
-            result = image_store.supabase.table('tasks')\
+            result = await image_store.supabase.table('tasks')\
                 .select('*')\
                 .eq('id', task_id)\
                 .execute()
@@ -382,7 +545,7 @@ async def create_account(ctx, username: str = None):
     
     try:
         # Check if the username is already taken
-        user_result = image_store.supabase.table('users')\
+        user_result = await image_store.supabase.table('users')\
             .select('*')\
             .eq('username', username)\
             .execute()
@@ -392,7 +555,7 @@ async def create_account(ctx, username: str = None):
             return
         
         # Check if the Discord user already has an account
-        discord_result = image_store.supabase.table('users')\
+        discord_result = await image_store.supabase.table('users')\
             .select('*')\
             .eq('discord_user_id', discord_user_id)\
             .execute()
@@ -410,7 +573,7 @@ async def create_account(ctx, username: str = None):
             'phone_number': None
         }
         
-        result = image_store.supabase.table('users')\
+        result = await image_store.supabase.table('users')\
             .insert(new_user)\
             .execute()
         
@@ -441,7 +604,7 @@ async def link_user(ctx, username: str = None):
     
     try:
         # Check if the Lockdin user exists
-        user_result = image_store.supabase.table('users')\
+        user_result = await image_store.supabase.table('users')\
             .select('*')\
             .eq('username', username)\
             .execute()
@@ -453,7 +616,7 @@ async def link_user(ctx, username: str = None):
         user_id = user_result.data[0]['id']
         
         # Update the user's discord_user_id
-        update_result = image_store.supabase.table('users')\
+        update_result = await image_store.supabase.table('users')\
             .update({'discord_user_id': discord_user_id})\
             .eq('id', user_id)\
             .execute()
@@ -502,6 +665,7 @@ This bot helps you stay accountable for your tasks in Lockdin. Here are the avai
 **System Commands:**
 • `!help` - Show this help message
 • `!storage_status` - Check the status of the storage system (for troubleshooting)
+• `!metrics` - Show runtime metrics such as image analysis cache hits (for troubleshooting)
 
 **How to use:**
 1. First, create an account with `!create_account <username>` or link your existing account with `!link <username>`
@@ -637,7 +801,7 @@ async def create_task(ctx, *, task_info: str = None):
     discord_user_id = str(ctx.author.id)
     
     # Check if user exists
-    user_result = image_store.supabase.table('users')\
+    user_result = await image_store.supabase.table('users')\
         .select('*')\
         .eq('discord_user_id', discord_user_id)\
         .execute()
@@ -688,12 +852,13 @@ async def create_task(ctx, *, task_info: str = None):
             'created_at': datetime.utcnow().isoformat()
         }
         
-        result = image_store.supabase.table('tasks')\
+        result = await image_store.supabase.table('tasks')\
             .insert(task_data)\
             .execute()
         
         if result.data and len(result.data) > 0:
             task_id = result.data[0]['id']
+            task_reminder.schedule_task(result.data[0], discord_user_id)
             await ctx.send(f"✅ Task created successfully! Task ID: {task_id}")
             await ctx.send(f"Description: {description}")
             await ctx.send(f"Due date: {ny_time_str} (New York time) or {utc_time_str} (UTC)")
@@ -719,7 +884,7 @@ async def storage_status(ctx):
     try:
         # Check if the notes bucket exists
         try:
-            files = image_store.supabase.storage.from_('notes').list()
+            files = await image_store.supabase.storage.from_('notes').list()
             await ctx.send(f"✅ Notes bucket exists and is accessible.")
             await ctx.send(f"Found {len(files)} files in the bucket.")
             
@@ -734,7 +899,7 @@ async def storage_status(ctx):
             
             # Try to create the bucket
             try:
-                image_store.supabase.storage.create_bucket('notes', {'public': True})
+                await image_store.supabase.storage.create_bucket('notes', {'public': True})
                 await ctx.send("✅ Created notes bucket successfully.")
             except Exception as create_error:
                 await ctx.send(f"❌ Could not create notes bucket: {str(create_error)}")
@@ -742,21 +907,21 @@ async def storage_status(ctx):
         
         # Check if the feed table exists
         try:
-            result = image_store.supabase.table('feed').select('*').limit(5).execute()
+            result = await image_store.supabase.table('feed').select('*').limit(5).execute()
             await ctx.send(f"✅ Feed table exists and has {len(result.data)} entries (showing up to 5).")
         except Exception as e:
             await ctx.send(f"❌ Error accessing feed table: {str(e)}")
         
         # Check if the tasks table exists
         try:
-            result = image_store.supabase.table('tasks').select('*').limit(5).execute()
+            result = await image_store.supabase.table('tasks').select('*').limit(5).execute()
             await ctx.send(f"✅ Tasks table exists and has {len(result.data)} entries (showing up to 5).")
         except Exception as e:
             await ctx.send(f"❌ Error accessing tasks table: {str(e)}")
         
         # Check if the users table exists
         try:
-            result = image_store.supabase.table('users').select('*').limit(5).execute()
+            result = await image_store.supabase.table('users').select('*').limit(5).execute()
             await ctx.send(f"✅ Users table exists and has {len(result.data)} entries (showing up to 5).")
         except Exception as e:
             await ctx.send(f"❌ Error accessing users table: {str(e)}")
@@ -764,6 +929,58 @@ async def storage_status(ctx):
     except Exception as e:
         await ctx.send(f"❌ Error checking storage status: {str(e)}")
 
+# Add a command to show runtime metrics
+@bot.command(name='metrics')
+async def metrics(ctx):
+    """Show runtime metrics for the bot (for troubleshooting)"""
+    cache_stats = analysis_cache.stats()
+    await ctx.send(
+        "**Image analysis cache:**\n"
+        f"Entries: {cache_stats['entries']} (disk tier: {'on' if cache_stats['disk_enabled'] else 'off'})\n"
+        f"Hits: {cache_stats['hits']} memory, {cache_stats['disk_hits']} disk\n"
+        f"Misses: {cache_stats['misses']}\n"
+        f"Hit rate: {cache_stats['hit_rate']:.1%}"
+    )
+    
+    history_stats = accountability_partner.conversation_history.stats()
+    await ctx.send(
+        "**Conversation history:**\n"
+        f"Tasks: {history_stats['tasks']}, messages: {history_stats['messages']}\n"
+        f"Size: {history_stats['bytes'] / 1024:.1f} KB, evictions: {history_stats['evictions']}"
+    )
+    
+    batch_stats = accountability_partner.batcher.stats()
+    await ctx.send(
+        "**Message generation batching:**\n"
+        f"Mode: {batch_stats['mode']}\n"
+        f"Messages: {batch_stats['items']} in {batch_stats['batches']} batches, "
+        f"{batch_stats['api_requests']} API requests"
+    )
+    
+    governor_stats = governor.stats()
+    await ctx.send(
+        "**OpenAI budget:**\n"
+        f"Circuit breaker: {governor_stats['state']} (tripped {governor_stats['breaker_trips']} times)\n"
+        f"Budget left this minute: {governor_stats['requests_left']} requests, {governor_stats['tokens_left']} tokens\n"
+        f"Rejected calls: {governor_stats['rejected']}"
+    )
+    
+    queue_stats = submission_queue.stats()
+    await ctx.send(
+        "**Submission queue:**\n"
+        f"Waiting: {queue_stats['waiting']}, in progress: {queue_stats['running']} ({queue_stats['workers']} workers)\n"
+        f"Processed: {queue_stats['processed']}, replaced by a newer image: {queue_stats['coalesced']}, turned away: {queue_stats['rejected']}"
+    )
+    
+    await ctx.send(f"**Recycled photo check:** {len(image_hash_index)} submission image hashes indexed")
+    
+    executor_stats = executor.stats()
+    await ctx.send(
+        "**OpenAI retries and hedging:**\n"
+        f"Requests: {executor_stats['requests']}, retries: {executor_stats['retries']}\n"
+        f"Hedges: {executor_stats['hedges_issued']} issued ({executor_stats['hedge_rate']:.1%}), {executor_stats['hedges_won']} won"
+    )
+
 # Add a command to reset a task's status
 @bot.command(name='reset_task')
 async def reset_task(ctx, task_id: str = None):
@@ -792,13 +1009,18 @@ async def reset_task(ctx, task_id: str = None):
         # Get the current status
         current_status = task['status']
         
-        # Reset the task status to pending
-        result = image_store.supabase.table('tasks')\
-            .update({'status': 'pending'})\
+        # Reset the task status to pending, with a fresh grace period before it can fail again.
+        # The grace period is stored on the task so the past-due sweep respects it after a restart too.
+        grace_until = datetime.utcnow() + task_reminder.past_due_buffer
+        result = await image_store.supabase.table('tasks')\
+            .update({'status': 'pending', 'grace_until': grace_until.isoformat() + '+00:00'})\
             .eq('id', task_id)\
             .execute()
         
         if result.data:
+            # Reschedule reminders; the past-due check waits for the grace period
+            task_reminder.schedule_task(result.data[0], discord_user_id)
+            task_reminder.publish_status(task['id'], 'pending')
             await ctx.send(f"✅ Task '{task['description']}' has been reset from '{current_status}' to 'pending'.")
             await ctx.send("You can now submit an image for this task.")
         else:
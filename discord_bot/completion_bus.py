@@ -0,0 +1,77 @@
+import asyncio
+
+
+class CompletionBus:
+    """
+    In-process notifications for task status changes.
+
+    Reminder sequences track the task they are reminding about and wait on the bus between
+    reminders instead of polling Supabase. Whoever changes a task's status (a successful
+    submission, !reset_task, the past-due sweep) publishes it here, and every waiter for that
+    task wakes up immediately. Changes made outside the bot are published by TaskReminder's
+    low-frequency status poll.
+    """
+
+    def __init__(self):
+        self._status = {}  # task_id -> last terminal status published while tracked (or None)
+        self._waiters = {}  # task_id -> set of futures
+
+    def track(self, task_id):
+        """
+        Start recording status changes for a task
+        """
+        self._status[task_id] = None
+
+    def untrack(self, task_id):
+        """
+        Stop recording status changes for a task and release any waiters
+        """
+        self._status.pop(task_id, None)
+        for future in self._waiters.pop(task_id, set()):
+            if not future.done():
+                future.set_result(None)
+
+    def publish(self, task_id, status):
+        """
+        Publish a task's new status. Anything other than 'pending' wakes its waiters.
+        """
+        if task_id not in self._status:
+            return
+        if status == 'pending':
+            self._status[task_id] = None
+            return
+
+        self._status[task_id] = status
+        for future in self._waiters.pop(task_id, set()):
+            if not future.done():
+                future.set_result(status)
+
+    def status(self, task_id):
+        """
+        Get the terminal status published for a tracked task, or None if it is still pending
+        """
+        return self._status.get(task_id)
+
+    def __len__(self):
+        return len(self._status)
+
+    async def wait(self, task_id, timeout):
+        """
+        Wait up to timeout seconds for a tracked task to leave 'pending'
+
+        Returns the new status, or None if the timeout expired first.
+        """
+        if self._status.get(task_id):
+            return self._status[task_id]
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(task_id, set())
+        waiters.add(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters.discard(future)
+            if not waiters and self._waiters.get(task_id) is waiters:
+                del self._waiters[task_id]
@@ -0,0 +1,18 @@
+-- Perceptual hashes of submission images, kept next to the feed table
+-- Run this in the Supabase SQL editor
+
+CREATE TABLE IF NOT EXISTS image_hashes (
+    id SERIAL PRIMARY KEY,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    feed_id INT REFERENCES feed(id) ON DELETE CASCADE,
+    task_id INT NOT NULL REFERENCES tasks(id),
+    user_id INT NOT NULL REFERENCES users(id),
+    dhash BIGINT NOT NULL,  -- 64-bit difference hash, stored as signed
+    image_url TEXT
+);
+
+-- The bot loads the whole table into its in-memory index at startup (paged by id);
+-- this index serves lookups of a task's hashes
+CREATE INDEX IF NOT EXISTS idx_image_hashes_task_id ON image_hashes(task_id);
+
+COMMENT ON TABLE image_hashes IS 'Perceptual hashes of submitted images, used to detect recycled proof photos';
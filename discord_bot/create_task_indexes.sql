@@ -0,0 +1,29 @@
+-- Columns and indexes used by the Discord bot's task scheduler
+-- Run these in the Supabase SQL editor
+
+-- Grace period of a task reset with !reset_task; the past-due sweep doesn't fail it before then
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS grace_until TIMESTAMP WITH TIME ZONE;
+
+-- Past-due sweep and due-soon lookups: range scans on due_time over pending tasks only
+CREATE INDEX IF NOT EXISTS idx_tasks_pending_due_time ON tasks(due_time) WHERE status = 'pending';
+
+-- Last change to a task, kept current by a trigger, for the incremental sync of tasks
+-- created or changed outside the bot (new tasks, edited due times, resets)
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION set_tasks_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tasks_set_updated_at ON tasks;
+CREATE TRIGGER tasks_set_updated_at BEFORE UPDATE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION set_tasks_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks(updated_at);
+DROP INDEX IF EXISTS idx_tasks_pending_created_at;
+
+-- Submission lookups embedded in task queries (feed(status))
+CREATE INDEX IF NOT EXISTS idx_feed_task_id ON feed(task_id);
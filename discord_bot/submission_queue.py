@@ -0,0 +1,98 @@
+import asyncio
+
+
+class SubmissionQueue:
+    """
+    Bounded work queue for image submissions, processed by a fixed pool of workers.
+
+    Jobs are keyed by user: a user's jobs never run concurrently, so two quick images can't
+    race on the same task. While a user's job is waiting (or one of theirs is running), a
+    newer job replaces the waiting one, so only the newest image gets processed. At most
+    max_pending users can be waiting at once; beyond that submit() refuses new work.
+    """
+
+    # Results of submit()
+    QUEUED = 'queued'
+    REPLACED = 'replaced'
+    FULL = 'full'
+
+    def __init__(self, handler, workers=4, max_pending=100):
+        self.handler = handler  # async (job) -> None
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = {}  # user_id -> newest waiting job
+        self._running = set()  # user_ids with a job in progress
+        self._ready = None  # user_ids whose waiting job can start
+        self._worker_tasks = []
+        self.processed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def start(self):
+        """
+        Start the worker pool (no-op if it's already running)
+        """
+        if self._worker_tasks:
+            return
+        self._ready = asyncio.Queue()
+        # Jobs submitted before start() are waiting for a worker too
+        for user_id in self._pending:
+            if user_id not in self._running:
+                self._ready.put_nowait(user_id)
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, user_id, job):
+        """
+        Queue a job for a user without waiting for it
+
+        Returns QUEUED, REPLACED if it took the place of the user's waiting job, or FULL if
+        too many users are already waiting.
+        """
+        if user_id in self._pending:
+            self._pending[user_id] = job
+            self.coalesced += 1
+            return self.REPLACED
+
+        if len(self._pending) >= self.max_pending:
+            self.rejected += 1
+            return self.FULL
+
+        self._pending[user_id] = job
+        # A user with a job in progress is re-queued when it finishes
+        if user_id not in self._running and self._ready is not None:
+            self._ready.put_nowait(user_id)
+        return self.QUEUED
+
+    async def _worker(self):
+        while True:
+            user_id = await self._ready.get()
+            job = self._pending.pop(user_id, None)
+            if job is None:
+                continue
+
+            self._running.add(user_id)
+            try:
+                await self.handler(job)
+            except Exception as e:
+                print(f"Error processing queued submission for user {user_id}: {str(e)}")
+            finally:
+                self._running.discard(user_id)
+                self.processed += 1
+                if user_id in self._pending:
+                    self._ready.put_nowait(user_id)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def stats(self):
+        """
+        Get the queue's depth and counters for display
+        """
+        return {
+            'waiting': len(self._pending),
+            'running': len(self._running),
+            'workers': self.workers,
+            'processed': self.processed,
+            'coalesced': self.coalesced,
+            'rejected': self.rejected
+        }
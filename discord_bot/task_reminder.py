@@ -4,9 +4,16 @@ import asyncio
 import os
 from typing import Dict, List, Optional
 import random
-from utils import ny_to_utc, utc_to_ny, format_datetime, is_dst_in_eastern_time
+from utils import ny_to_utc, utc_to_ny, format_datetime, is_dst_in_eastern_time, parse_utc
+from task_scheduler import TaskScheduler
+from completion_bus import CompletionBus
 
 class TaskReminder:
+    # Task columns plus the owner's Discord ID and submission states, fetched in one round trip
+    DUE_TASK_COLUMNS = 'id, description, due_time, grace_until, status, user_id, users(discord_user_id), feed(status)'
+    # Rows per page of the past-due sweep; PostgREST caps a response at 1000 rows
+    PAST_DUE_PAGE_SIZE = 1000
+    
     def __init__(self, bot, image_store, accountability_partner):
         self.bot = bot
         self.image_store = image_store
@@ -15,254 +22,365 @@ class TaskReminder:
         self.reminder_intervals = [0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5]  # 10 reminders at 30-second intervals (5 minutes total)
         self.active_reminders = {}  # Dictionary to track active reminders by task_id
         self.completed_tasks = set()  # Set to track completed tasks
+        # Reminder sequences start this long before the due time
+        self.reminder_lead = timedelta(minutes=5)
+        # Buffer after the due time before a task is marked as failed, to prevent premature failures
+        self.past_due_buffer = timedelta(minutes=5)
+        # How often to pick up tasks created or changed outside the bot (web app, WhatsApp)
+        self.resync_interval = int(os.getenv('TASK_RESYNC_SECONDS', '300'))
+        # How often running reminder sequences check for status changes made outside the bot
+        self.status_poll_interval = int(os.getenv('TASK_STATUS_POLL_SECONDS', '60'))
+        self.scheduler = TaskScheduler()
+        self.scheduler.register('remind', self.on_reminders_due)
+        self.scheduler.register('past_due', self.on_past_due)
+        self.completion_bus = CompletionBus()
+        self._synced_at = None
+        self._started = False
+        # Upper bound of the due_time window covered by the last past-due sweep
+        self._past_due_watermark = None
+        self._sweep_lock = asyncio.Lock()
+        
+    async def start(self):
+        """
+        Load every pending task into the scheduler once, then fire reminder and past-due
+        events at their exact times. Safe to call more than once (on_ready can fire again
+        after a reconnect).
+        """
+        if self._started:
+            return
+        self._started = True
         
-    async def check_upcoming_tasks(self):
+        await self.load_pending_tasks()
+        print(f"Scheduled {len(self.scheduler)} reminder/past-due events")
+        
+        asyncio.create_task(self.resync_new_tasks())
+        asyncio.create_task(self.poll_reminded_task_statuses())
+        await self.scheduler.run()
+    
+    async def load_pending_tasks(self, updated_since=None, page_size: int = 1000):
         """
-        Periodically check for tasks that are due within 5 minutes
+        Fetch pending tasks page by page and schedule them
+
+        With a watermark, every task updated since then is fetched instead, whatever its
+        status: new tasks, edited due times and resets are (re)scheduled, and tasks that
+        left pending are unscheduled.
         """
+        synced_at = datetime.utcnow()
+        count = 0
+        last_id = 0
         while True:
+            query = self.image_store.supabase.table('tasks')\
+                .select('*, users(discord_user_id)')\
+                .gt('id', last_id)
+            if updated_since:
+                query = query.gte('updated_at', updated_since.isoformat())
+            else:
+                query = query.eq('status', 'pending')
+            
+            result = await query.order('id').limit(page_size).execute()
+            for task in result.data or []:
+                self.schedule_task(task)
+            count += len(result.data or [])
+            if not result.data or len(result.data) < page_size:
+                break
+            last_id = result.data[-1]['id']
+        
+        self._synced_at = synced_at
+        return count
+    
+    async def resync_new_tasks(self):
+        """
+        Periodically pick up tasks that were created or changed outside the bot since the last sync
+        """
+        while True:
+            await asyncio.sleep(self.resync_interval)
             try:
-                # Get current time in UTC
-                now = datetime.utcnow()
-                print(f"Checking for upcoming tasks at {now.isoformat()}")
-                
-                # Time 5 minutes from now
-                five_min_future = now + timedelta(minutes=5)
-                print(f"Looking for tasks due between {now.isoformat()} and {five_min_future.isoformat()}")
-                
-                # Query Supabase for tasks due in the next 5 minutes
-                result = self.image_store.supabase.table('tasks')\
-                    .select('*, users(*)')\
-                    .eq('status', 'pending')\
-                    .gte('due_time', now.isoformat())\
-                    .lte('due_time', five_min_future.isoformat())\
+                count = await self.load_pending_tasks(updated_since=self._synced_at)
+                if count:
+                    print(f"Resynced {count} tasks updated outside the bot")
+            except Exception as e:
+                print(f"Error syncing new tasks: {str(e)}")
+    
+    async def poll_reminded_task_statuses(self):
+        """
+        Periodically check the status of tasks with a running reminder sequence
+        
+        Status changes made inside the bot are published on the completion bus right away;
+        this low-frequency poll catches the ones made elsewhere (a WhatsApp submission, the
+        web app, a direct database update), with one query for all running sequences.
+        """
+        while True:
+            await asyncio.sleep(self.status_poll_interval)
+            task_ids = list(self.active_reminders)
+            if not task_ids:
+                continue
+            try:
+                result = await self.image_store.supabase.table('tasks')\
+                    .select('id, status')\
+                    .in_('id', task_ids)\
+                    .neq('status', 'pending')\
                     .execute()
-                
-                upcoming_tasks = result.data
-                print(f"Found {len(upcoming_tasks)} tasks due in the next 5 minutes")
-                
-                # If no tasks found, log all pending tasks for debugging
-                if len(upcoming_tasks) == 0:
-                    print("Checking all pending tasks for debugging:")
-                    all_pending = self.image_store.supabase.table('tasks')\
-                        .select('id, description, due_time, status')\
+                for task in result.data or []:
+                    print(f"Task {task['id']} became {task['status']} outside the bot")
+                    self.publish_status(task['id'], task['status'])
+            except Exception as e:
+                print(f"Error polling reminded task statuses: {str(e)}")
+    
+    def schedule_task(self, task, discord_user_id=None, not_before=None):
+        """
+        Schedule the reminder sequence and past-due check for a task, replacing any existing events.
+        Tasks that are no longer pending are removed from the scheduler.
+        
+        not_before delays the past-due check, e.g. to give a reset task a fresh grace period.
+        It defaults to the task's persisted grace_until, so the grace period survives a restart.
+        """
+        task_id = task['id']
+        if task.get('status', 'pending') != 'pending':
+            self.unschedule_task(task_id)
+            return
+        
+        try:
+            due_time = parse_utc(task['due_time'])
+        except Exception as e:
+            print(f"Error parsing due time for task {task_id}: {str(e)}")
+            return
+        
+        if discord_user_id:
+            task = {**task, 'users': {'discord_user_id': discord_user_id}}
+        
+        now = datetime.utcnow()
+        if due_time > now:
+            self.scheduler.schedule(task_id, 'remind', due_time - self.reminder_lead, task)
+        else:
+            self.scheduler.cancel(task_id, 'remind')
+        
+        past_due_at = due_time + self.past_due_buffer
+        if not_before is None:
+            not_before = self.grace_deadline(task)
+        if not_before and not_before > past_due_at:
+            past_due_at = not_before
+        self.scheduler.schedule(task_id, 'past_due', past_due_at, task)
+    
+    @staticmethod
+    def grace_deadline(task):
+        """
+        Get the naive UTC time before which a reset task can't fail, or None
+        """
+        if not task.get('grace_until'):
+            return None
+        try:
+            return parse_utc(task['grace_until'])
+        except Exception as e:
+            print(f"Error parsing grace period for task {task['id']}: {str(e)}")
+            return None
+    
+    def unschedule_task(self, task_id):
+        """
+        Drop all scheduled events for a task (e.g. once it has been completed)
+        """
+        self.scheduler.cancel(task_id)
+    
+    async def on_reminders_due(self, tasks):
+        """
+        Start reminder sequences for tasks whose reminder window just opened
+        
+        All tasks that came due in this tick are refreshed with a single query that returns
+        their current status, Discord user ID and submission state, so a burst of tasks due
+        at the same minute costs one round trip.
+        """
+        task_ids = [task['id'] for task in tasks if task['id'] not in self.active_reminders]
+        if not task_ids:
+            return
+        
+        try:
+            result = await self.image_store.supabase.table('tasks')\
+                .select(self.DUE_TASK_COLUMNS)\
+                .eq('status', 'pending')\
+                .in_('id', task_ids)\
+                .execute()
+        except Exception as e:
+            print(f"Error fetching tasks due soon: {str(e)}")
+            return
+        
+        for task in result.data or []:
+            task_id = task['id']
+            discord_user_id = (task.get('users') or {}).get('discord_user_id')
+            
+            # Skip if no Discord user ID or if reminder is already active
+            if not discord_user_id:
+                print(f"No Discord user ID for task {task_id}")
+                continue
+            
+            if task_id in self.active_reminders:
+                print(f"Reminder already active for task {task_id}")
+                continue
+            
+            # Skip if the task already has a successful image submission
+            if self.has_completed_submission(task):
+                print(f"Task {task_id} already has an image submission. Skipping.")
+                continue
+            
+            # Start a reminder sequence for this task
+            print(f"Starting reminder sequence for task {task_id}")
+            asyncio.create_task(self.start_reminder_sequence(task, discord_user_id))
+    
+    @staticmethod
+    def has_completed_submission(task):
+        """
+        Check the embedded feed(status) rows of a task for a completed submission
+        """
+        return any(entry.get('status') == 'completed' for entry in task.get('feed') or [])
+    
+    async def on_past_due(self, tasks):
+        """
+        Run one past-due sweep for every past-due event that fired in this tick
+        """
+        # Tasks due inside the sweep window are found by the watermark query; only tasks
+        # that fell behind the watermark (reset grace periods, deferred checks) are passed by id
+        watermark = self._past_due_watermark
+        task_ids = []
+        if watermark is not None:
+            for task in tasks:
+                try:
+                    if parse_utc(task['due_time']) <= watermark:
+                        task_ids.append(task['id'])
+                except Exception as e:
+                    print(f"Error parsing due time for task {task['id']}: {str(e)}")
+        
+        await self.check_past_due_tasks(task_ids)
+    
+    async def check_past_due_tasks(self, task_ids=()):
+        """
+        Mark newly past-due tasks as failed in one bulk update and notify their users
+        
+        Only tasks whose due_time + buffer passed since the previous sweep (the watermark) are
+        fetched, plus any explicitly passed task_ids, so the cost depends on the number of
+        newly overdue tasks rather than on the number of pending tasks. The window is read
+        page by page in due_time order, and the watermark only advances once the bulk update
+        has succeeded.
+        """
+        async with self._sweep_lock:
+            cutoff = datetime.utcnow() - self.past_due_buffer
+            
+            try:
+                candidates = {}
+                start = 0
+                while True:
+                    query = self.image_store.supabase.table('tasks')\
+                        .select(self.DUE_TASK_COLUMNS)\
                         .eq('status', 'pending')\
+                        .lte('due_time', cutoff.isoformat())
+                    if self._past_due_watermark is not None:
+                        query = query.gt('due_time', self._past_due_watermark.isoformat())
+                    result = await query.order('due_time').order('id')\
+                        .range(start, start + self.PAST_DUE_PAGE_SIZE - 1)\
                         .execute()
-                    
-                    if all_pending.data:
-                        for task in all_pending.data:
-                            try:
-                                task_due = datetime.fromisoformat(task['due_time'].replace('Z', '+00:00'))
-                                time_diff = task_due - now
-                                minutes_diff = time_diff.total_seconds() / 60
-                                print(f"  Task {task['id']}: {task['description']}")
-                                print(f"    Due time: {task['due_time']}")
-                                print(f"    Minutes until due: {minutes_diff:.2f}")
-                                print(f"    Would be included in upcoming: {0 <= minutes_diff <= 5}")
-                            except Exception as e:
-                                print(f"    Error parsing due time: {str(e)}")
-                    else:
-                        print("  No pending tasks found at all.")
+                    candidates.update({task['id']: task for task in result.data or []})
+                    if not result.data or len(result.data) < self.PAST_DUE_PAGE_SIZE:
+                        break
+                    start += self.PAST_DUE_PAGE_SIZE
                 
-                # Process each upcoming task
-                for task in upcoming_tasks:
-                    task_id = task['id']
-                    description = task.get('description', 'Unknown task')
-                    
-                    # Verify the due time is actually within the next 5 minutes
-                    try:
-                        due_time_str = task['due_time']
-                        due_time = datetime.fromisoformat(due_time_str.replace('Z', '+00:00'))
-                        
-                        time_diff = due_time - now
-                        minutes_diff = time_diff.total_seconds() / 60
-                        
-                        print(f"Task {task_id}: {description}")
-                        print(f"  Due time: {due_time.isoformat()}")
-                        print(f"  Minutes until due: {minutes_diff:.2f}")
-                        
-                        # Skip if the task is due more than 5 minutes from now
-                        if minutes_diff > 5:
-                            print(f"  Task {task_id} is due more than 5 minutes from now. Skipping.")
-                            continue
-                        
-                        # Skip if the task is already past due
-                        if minutes_diff < 0:
-                            print(f"  Task {task_id} is already past due. Skipping.")
-                            continue
-                    except Exception as e:
-                        print(f"Error parsing due time for task {task_id}: {str(e)}")
-                        continue
-                    
-                    # Get the user associated with this task
-                    user_id = task['user_id']
-                    print(f"  User ID: {user_id}")
-                    
-                    # Get the Discord user ID from the users table
-                    user_result = self.image_store.supabase.table('users')\
-                        .select('discord_user_id')\
-                        .eq('id', user_id)\
+                if task_ids:
+                    result = await self.image_store.supabase.table('tasks')\
+                        .select(self.DUE_TASK_COLUMNS)\
+                        .eq('status', 'pending')\
+                        .in_('id', list(task_ids))\
                         .execute()
-                    
-                    if not user_result.data or len(user_result.data) == 0:
-                        print(f"  No user found for task {task_id}")
-                        continue
-                    
-                    discord_user_id = user_result.data[0]['discord_user_id']
-                    print(f"  Discord user ID: {discord_user_id}")
-                    
-                    # Skip if no Discord user ID or if reminder is already active
-                    if not discord_user_id:
-                        print(f"  No Discord user ID for task {task_id}")
-                        continue
-                        
-                    if task_id in self.active_reminders:
-                        print(f"  Reminder already active for task {task_id}")
-                        continue
-                    
-                    # Check if there are any image submissions for this task
-                    try:
-                        has_image = await self.image_store.check_task_has_image(task_id)
-                        print(f"  Has image submission: {has_image}")
-                        
-                        # Skip if the task already has an image submission
-                        if has_image:
-                            print(f"  Task {task_id} already has an image submission. Skipping.")
-                            continue
-                    except Exception as e:
-                        # If there's an error, log it and continue anyway
-                        print(f"  Error checking if task has image: {str(e)}")
-                    
-                    # Start a reminder sequence for this task
-                    print(f"  Starting reminder sequence for task {task_id}")
-                    asyncio.create_task(self.start_reminder_sequence(task, discord_user_id))
+                    candidates.update({task['id']: task for task in result.data or []})
+            except Exception as e:
+                print(f"Error checking past due tasks: {str(e)}")
+                return
+            
+            to_fail = []
+            now = datetime.utcnow()
+            for task_id, task in candidates.items():
+                # A reset task is still in its grace period; check it again when that ends
+                grace_until = self.grace_deadline(task)
+                if grace_until and grace_until > now:
+                    self.scheduler.schedule(task_id, 'past_due', grace_until, task)
+                    continue
                 
-                # Also check for tasks that are past due and haven't been completed
-                await self.check_past_due_tasks()
+                # Check again shortly if a reminder sequence is still running for this task
+                if task_id in self.active_reminders:
+                    self.scheduler.schedule(task_id, 'past_due', datetime.utcnow() + timedelta(minutes=1), task)
+                    continue
                 
-                # Check every 30 seconds
-                await asyncio.sleep(30)
+                # A completed feed entry means the submission went through; don't fail the task
+                if self.has_completed_submission(task):
+                    continue
                 
+                to_fail.append(task)
+            
+            try:
+                failed_ids = set(await self.image_store.fail_tasks([task['id'] for task in to_fail]))
             except Exception as e:
-                print(f"Error checking upcoming tasks: {str(e)}")
-                await asyncio.sleep(30)  # Wait 30 seconds before trying again
+                # Keep the watermark where it was and retry these tasks shortly
+                print(f"Error marking past due tasks as failed: {str(e)}")
+                retry_at = datetime.utcnow() + timedelta(minutes=1)
+                for task in to_fail:
+                    self.scheduler.schedule(task['id'], 'past_due', retry_at, task)
+                return
+            
+            # Only move past this window once every task in it has been handled
+            self._past_due_watermark = cutoff
+            if not to_fail:
+                return
+            
+            failed = [task for task in to_fail if task['id'] in failed_ids]
+            print(f"Marked {len(failed)} past due tasks as failed")
+        
+        for task in failed:
+            self.publish_status(task['id'], 'failed')
+        
+        await asyncio.gather(*(self.notify_task_failed(task) for task in failed))
     
-    async def check_past_due_tasks(self):
+    async def notify_task_failed(self, task):
         """
-        Check for tasks that are past due and mark them as failed
+        Send the failure notification for a task that was marked as failed
         """
+        task_id = task['id']
+        due_time_str = task['due_time']
+        
         try:
-            # Get all pending tasks
-            result = self.image_store.supabase.table('tasks')\
-                .select('*, users!inner(*)')\
-                .eq('status', 'pending')\
-                .execute()
+            due_time = parse_utc(due_time_str)
             
-            if not result.data:
+            # Get the Discord user
+            discord_user_id = (task.get('users') or {}).get('discord_user_id')
+            if not discord_user_id:
+                print(f"No Discord user ID for failed task {task_id}")
                 return
             
-            now_utc = datetime.utcnow()
-            buffer_minutes = 5  # Add a 5-minute buffer to prevent premature failures
+            user = await self.bot.fetch_user(int(discord_user_id))
             
-            for task in result.data:
-                task_id = task['id']
+            if user:
+                # Convert to New York time for display
+                due_time_ny = utc_to_ny(due_time)
                 
-                # Skip if this task is already being processed
-                if task_id in self.active_reminders:
-                    continue
+                # Send failure notification
+                ai_message = await self.accountability_partner.generate_failure_message(
+                    task_description=task['description'],
+                    due_date=due_time_str,
+                    due_time_local=format_datetime(due_time_ny, True),
+                    task_id=task_id
+                )
                 
-                try:
-                    # Parse the due time
-                    due_time_str = task['due_time']
-                    due_time = datetime.fromisoformat(due_time_str.replace('Z', '+00:00'))
-                    
-                    # Convert to New York time for logging
-                    due_time_ny = utc_to_ny(due_time)
-                    
-                    # Calculate time difference in minutes
-                    time_diff = due_time - now_utc
-                    minutes_diff = int(time_diff.total_seconds() / 60)
-                    hours_diff = minutes_diff / 60
-                    
-                    # Log the due time and time difference for debugging
-                    print(f"Task {task_id} due time (UTC): {due_time.isoformat()}")
-                    print(f"Task {task_id} due time (NY): {due_time_ny.isoformat()}")
-                    print(f"Current time (UTC): {now_utc.isoformat()}")
-                    print(f"Time difference: {hours_diff:.2f} hours ({minutes_diff} minutes)")
-                    
-                    # Add buffer time (5 minutes)
-                    buffer_time = due_time + timedelta(minutes=buffer_minutes)
-                    
-                    # Check if the task is past due (with buffer)
-                    if now_utc > buffer_time:
-                        print(f"Task {task_id} is past due. Due: {due_time.isoformat()}, Now: {now_utc.isoformat()}")
-                        
-                        # Check if the task has an image submission
-                        has_image = await self.image_store.check_task_has_image(task_id)
-                        
-                        if not has_image:
-                            # Mark the task as failed
-                            await self.image_store.update_task_status(task_id, 'failed')
-                            
-                            # Get the Discord user
-                            discord_user_id = task['users']['discord_user_id']
-                            user = await self.bot.fetch_user(int(discord_user_id))
-                            
-                            if user:
-                                # Send failure notification
-                                ai_message = await self.accountability_partner.generate_failure_message(
-                                    task_description=task['description'],
-                                    due_date=due_time_str,
-                                    due_time_local=format_datetime(due_time_ny, True),
-                                    task_id=task_id
-                                )
-                                
-                                await user.send(ai_message)
-                                await asyncio.sleep(1)
-                                await user.send(f"To reset this task, use: `!reset_task {task_id}`")
-                                
-                                print(f"Marked task {task_id} as failed and notified user {user.name}")
-                            else:
-                                print(f"Could not find Discord user with ID: {discord_user_id}")
-                        else:
-                            print(f"Task {task_id} has an image submission, not marking as failed")
-                    else:
-                        # Task is not past due yet
-                        buffer_diff = buffer_time - now_utc
-                        buffer_minutes_left = int(buffer_diff.total_seconds() / 60)
-                        
-                        # Calculate days, hours, minutes for clearer reporting
-                        days_left = buffer_minutes_left // (24 * 60)
-                        hours_left = (buffer_minutes_left % (24 * 60)) // 60
-                        mins_left = buffer_minutes_left % 60
-                        
-                        time_left_str = ""
-                        if days_left > 0:
-                            time_left_str += f"{days_left} days, "
-                        if hours_left > 0 or days_left > 0:
-                            time_left_str += f"{hours_left} hours, "
-                        time_left_str += f"{mins_left} minutes"
-                        
-                        # Format the due date for display
-                        due_date_str = due_time.strftime("%Y-%m-%d")
-                        due_time_str = due_time.strftime("%H:%M:%S")
-                        ny_due_date_str = due_time_ny.strftime("%Y-%m-%d")
-                        ny_due_time_str = due_time_ny.strftime("%H:%M:%S")
-                        
-                        print(f"Task {task_id} is not past due yet.")
-                        print(f"  Due on: {due_date_str} at {due_time_str} UTC ({ny_due_date_str} at {ny_due_time_str} NY time)")
-                        print(f"  Time left: {time_left_str} ({buffer_minutes_left} total minutes with buffer)")
+                await user.send(ai_message)
+                await asyncio.sleep(1)
+                await user.send(f"To reset this task, use: `!reset_task {task_id}`")
                 
-                except Exception as e:
-                    print(f"Error processing task {task_id}: {str(e)}")
-                    continue
-                    
+                print(f"Marked task {task_id} as failed and notified user {user.name}")
+            else:
+                print(f"Could not find Discord user with ID: {discord_user_id}")
         except Exception as e:
-            print(f"Error checking past due tasks: {str(e)}")
+            print(f"Error notifying user about failed task {task_id}: {str(e)}")
     
     async def start_reminder_sequence(self, task, discord_user_id):
         """
         Start a sequence of increasingly urgent reminders for a task
+        
+        The sequence waits on the completion bus between reminders, so it stops as soon as
+        the task is completed, failed or otherwise leaves 'pending'. Changes made outside the bot
+        arrive through poll_reminded_task_statuses.
         """
         task_id = task['id']
         description = task['description']
@@ -270,7 +388,7 @@ class TaskReminder:
         # Parse the due time
         try:
             due_time_str = task['due_time']
-            due_time = datetime.fromisoformat(due_time_str.replace('Z', '+00:00'))
+            due_time = parse_utc(due_time_str)
             print(f"Starting reminder sequence for task {task_id}: {description}")
             print(f"Due time: {due_time.isoformat()}")
             print(f"Discord user ID: {discord_user_id}")
@@ -280,11 +398,18 @@ class TaskReminder:
         
         # Mark this task as having an active reminder
         self.active_reminders[task_id] = True
+        self.completion_bus.track(task_id)
         print(f"Marked task {task_id} as having an active reminder")
         
         # Initialize conversation history for this task
         self.accountability_partner.clear_conversation(task_id)
-        print(f"Cleared conversation history for task {task_id}")
+        
+        # Generate every escalation level up front so each reminder goes out on time
+        pregenerated = self.accountability_partner.pregenerate_reminder_messages(
+            task_description=description,
+            due_time_local=format_datetime(utc_to_ny(due_time), True),
+            reminder_counts=range(len(self.reminder_intervals) + 1)
+        )
         
         try:
             # Get the Discord user
@@ -295,108 +420,62 @@ class TaskReminder:
                     print(f"Found Discord user: {user.name} (ID: {user.id})")
                 else:
                     print(f"Could not find Discord user with ID: {discord_user_id}")
-                    del self.active_reminders[task_id]
                     return
             except Exception as e:
                 print(f"Error fetching Discord user: {str(e)}")
-                del self.active_reminders[task_id]
                 return
             
             # Send initial reminder
             print(f"Sending initial reminder for task {task_id} to user {user.name}")
             try:
-                await self.send_reminder(user, task, 0, reminder_count=0)
+                await self.send_reminder(user, task, 0, reminder_count=0, pregenerated=pregenerated)
                 print(f"Initial reminder sent successfully for task {task_id}")
             except Exception as e:
                 print(f"Error sending initial reminder: {str(e)}")
-                del self.active_reminders[task_id]
                 return
             
             # Send increasingly urgent reminders at intervals
             for i, interval in enumerate(self.reminder_intervals):
-                # Check if task is still pending before sending next reminder
-                task_status = await self.check_task_status(task_id)
-                print(f"Task {task_id} status: {task_status}")
-                if task_status != 'pending':
-                    print(f"Task {task_id} is no longer pending. Stopping reminders.")
-                    break
-                
-                # Check if there are any image submissions for this task
-                try:
-                    has_image = await self.image_store.check_task_has_image(task_id)
-                    print(f"Task {task_id} has image: {has_image}")
-                    if has_image:
-                        print(f"Task {task_id} has an image submission. Stopping reminders.")
-                        break
-                except Exception as e:
-                    print(f"Error checking if task has image: {str(e)}")
-                
-                # Wait for the specified interval
-                print(f"Waiting {interval} minutes before sending next reminder for task {task_id}")
-                await asyncio.sleep(interval * 60)  # Convert minutes to seconds
-                
-                # Check again if task is still pending and has no image
-                task_status = await self.check_task_status(task_id)
-                print(f"Task {task_id} status after waiting: {task_status}")
-                if task_status != 'pending':
-                    print(f"Task {task_id} is no longer pending. Stopping reminders.")
+                # Wait for the interval, waking immediately if the task leaves 'pending'
+                status = await self.completion_bus.wait(task_id, interval * 60)  # Convert minutes to seconds
+                if status:
+                    print(f"Task {task_id} is now {status}. Stopping reminders.")
                     break
                 
-                try:
-                    has_image = await self.image_store.check_task_has_image(task_id)
-                    print(f"Task {task_id} has image after waiting: {has_image}")
-                    if has_image:
-                        print(f"Task {task_id} has an image submission. Stopping reminders.")
-                        break
-                except Exception as e:
-                    print(f"Error checking if task has image: {str(e)}")
-                
                 # Send next reminder with increased urgency
                 reminder_count = i + 1  # Reminder count starts at 0 for the initial reminder
-                print(f"Sending reminder #{reminder_count} for task {task_id} to user {user.name}")
                 try:
-                    await self.send_reminder(user, task, min(10, i + 1), reminder_count=reminder_count)
+                    await self.send_reminder(user, task, min(10, i + 1), reminder_count=reminder_count, pregenerated=pregenerated)
                     print(f"Reminder #{reminder_count} sent successfully for task {task_id}")
                 except Exception as e:
                     print(f"Error sending reminder #{reminder_count}: {str(e)}")
             
-            # Clear the active reminder flag
-            if task_id in self.active_reminders:
-                del self.active_reminders[task_id]
-                print(f"Cleared active reminder flag for task {task_id}")
-                
-            # Clear conversation history after the sequence is complete
-            self.accountability_partner.clear_conversation(task_id)
-            print(f"Cleared conversation history for task {task_id} after sequence completion")
-            
         except Exception as e:
             print(f"Error in reminder sequence for task {task_id}: {str(e)}")
-            if task_id in self.active_reminders:
-                del self.active_reminders[task_id]
-                print(f"Cleared active reminder flag for task {task_id} due to error")
+        finally:
+            for pending_template in pregenerated.values():
+                pending_template.cancel()
+            # Clear the active reminder flag and conversation history
+            self.active_reminders.pop(task_id, None)
+            self.completion_bus.untrack(task_id)
+            self.accountability_partner.clear_conversation(task_id)
+            print(f"Cleared active reminder for task {task_id}")
     
-    async def check_task_status(self, task_id):
+    def publish_status(self, task_id, status):
         """
-        Check the current status of a task
+        Notify running reminder sequences and the scheduler that a task changed status
         """
-        try:
-            result = self.image_store.supabase.table('tasks')\
-                .select('status')\
-                .eq('id', task_id)\
-                .execute()
-            
-            if not result.data or len(result.data) == 0:
-                print(f"No task found with ID: {task_id}")
-                return None
-                
-            return result.data[0]['status']
-        except Exception as e:
-            print(f"Error checking task status: {str(e)}")
-            return None
+        self.completion_bus.publish(task_id, status)
+        if status != 'pending':
+            self.unschedule_task(task_id)
     
-    async def send_reminder(self, user, task, urgency_level, reminder_count=0):
+    async def send_reminder(self, user, task, urgency_level, reminder_count=0, pregenerated=None):
         """
         Send a reminder message with appropriate urgency level using AI
+        
+        pregenerated is an optional dict of reminder_count -> task of the sequence's
+        pre-generated reminder templates; the message is generated on demand if this level
+        is missing or failed.
         """
         try:
             task_id = task['id']
@@ -404,7 +483,7 @@ class TaskReminder:
             print(f"Preparing reminder for task {task_id}: {description}")
             
             try:
-                due_time = datetime.fromisoformat(task['due_time'].replace('Z', '+00:00'))
+                due_time = parse_utc(task['due_time'])
                 print(f"Parsed due time: {due_time.isoformat()}")
             except Exception as e:
                 print(f"Error parsing due time: {str(e)}")
@@ -441,22 +520,32 @@ class TaskReminder:
             time_remaining = f"{minutes_left} minutes and {seconds_left} seconds"
             print(f"Formatted time remaining: {time_remaining}")
             
-            # Generate AI reminder message with increasing urgency
-            print(f"Generating AI reminder message with urgency level {urgency_level} and reminder count {reminder_count}")
-            try:
-                ai_message = await self.accountability_partner.generate_reminder_message(
-                    task_description=description,
-                    time_remaining=time_remaining,
-                    urgency_level=urgency_level,
-                    due_time_local=due_time_ny_str,
-                    task_id=task_id,
-                    reminder_count=reminder_count
-                )
-                print(f"Generated AI message: {ai_message[:50]}...")  # Log first 50 chars
-            except Exception as e:
-                print(f"Error generating AI message: {str(e)}")
-                ai_message = f"⏰ Reminder: Your task \"{description}\" is due soon! You have {time_remaining} left to complete it."
-                print(f"Using fallback message: {ai_message}")
+            # Use the pre-generated message for this level if there is one
+            ai_message = None
+            if pregenerated and reminder_count in pregenerated:
+                template = await pregenerated[reminder_count]
+                if template is not None:
+                    ai_message = self.accountability_partner.render_reminder(
+                        template, time_remaining, task_id=task_id
+                    )
+            
+            # Otherwise generate AI reminder message with increasing urgency
+            if ai_message is None:
+                print(f"Generating AI reminder message with urgency level {urgency_level} and reminder count {reminder_count}")
+                try:
+                    ai_message = await self.accountability_partner.generate_reminder_message(
+                        task_description=description,
+                        time_remaining=time_remaining,
+                        urgency_level=urgency_level,
+                        due_time_local=due_time_ny_str,
+                        task_id=task_id,
+                        reminder_count=reminder_count
+                    )
+                    print(f"Generated AI message: {ai_message[:50]}...")  # Log first 50 chars
+                except Exception as e:
+                    print(f"Error generating AI message: {str(e)}")
+                    ai_message = f"⏰ Reminder: Your task \"{description}\" is due soon! You have {time_remaining} left to complete it."
+                    print(f"Using fallback message: {ai_message}")
             
             # Send the AI-generated message
             print(f"Sending message to user {user.name} (ID: {user.id})")
@@ -480,7 +569,7 @@ class TaskReminder:
         try:
             task_id = task['id']
             description = task['description']
-            due_time = datetime.fromisoformat(task['due_time'].replace('Z', '+00:00'))
+            due_time = parse_utc(task['due_time'])
             
             # Convert UTC due time to New York time for display
             due_time_ny = utc_to_ny(due_time)
@@ -0,0 +1,115 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime
+
+
+class TaskScheduler:
+    """
+    In-memory min-heap of timed task events keyed on their fire time (naive UTC).
+
+    Each (task_id, kind) pair has at most one live event. Rescheduling or cancelling an
+    event marks the old heap entry dead instead of searching the heap for it; dead entries
+    are discarded when they reach the top. Events that come due in the same tick are
+    grouped by kind and handed to that kind's handler as one list.
+    """
+
+    # Upper bound on a single sleep so wall-clock adjustments are picked up
+    MAX_SLEEP_SECONDS = 60
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}  # (task_id, kind) -> heap entry
+        self._handlers = {}  # kind -> async handler(list of payloads)
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._running = set()  # Strong references to in-flight handler tasks
+
+    def register(self, kind, handler):
+        """
+        Register the coroutine function that handles events of the given kind
+        """
+        self._handlers[kind] = handler
+
+    def schedule(self, task_id, kind, when, payload=None):
+        """
+        Schedule (or reschedule) the event of the given kind for a task
+        """
+        self.cancel(task_id, kind)
+        entry = [when, next(self._counter), task_id, kind, payload, True]
+        self._entries[(task_id, kind)] = entry
+        heapq.heappush(self._heap, entry)
+
+        # Wake the run loop if this event is now the earliest one
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    def cancel(self, task_id, kind=None):
+        """
+        Cancel the event of the given kind for a task, or all of its events if kind is None
+        """
+        kinds = [kind] if kind else list(self._handlers)
+        for k in kinds:
+            entry = self._entries.pop((task_id, k), None)
+            if entry:
+                entry[-1] = False
+
+    def is_scheduled(self, task_id, kind):
+        return (task_id, kind) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def next_fire_time(self):
+        """
+        Get the fire time of the earliest live event, or None if nothing is scheduled
+        """
+        self._discard_dead()
+        return self._heap[0][0] if self._heap else None
+
+    def _discard_dead(self):
+        while self._heap and not self._heap[0][-1]:
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        """
+        Pop every live event whose fire time has passed, grouped by kind
+        """
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            when, _, task_id, kind, payload, alive = heapq.heappop(self._heap)
+            if not alive:
+                continue
+            del self._entries[(task_id, kind)]
+            due.setdefault(kind, []).append(payload)
+        return due
+
+    async def _dispatch(self, kind, payloads):
+        try:
+            await self._handlers[kind](payloads)
+        except Exception as e:
+            print(f"Error handling {len(payloads)} scheduled '{kind}' event(s): {str(e)}")
+
+    async def run(self):
+        """
+        Fire events at their scheduled times until cancelled
+        """
+        while True:
+            next_time = self.next_fire_time()
+            now = datetime.utcnow()
+
+            if next_time is None or next_time > now:
+                timeout = self.MAX_SLEEP_SECONDS
+                if next_time is not None:
+                    timeout = min(timeout, (next_time - now).total_seconds())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for kind, payloads in self._pop_due(now).items():
+                handler_task = asyncio.create_task(self._dispatch(kind, payloads))
+                self._running.add(handler_task)
+                handler_task.add_done_callback(self._running.discard)
@@ -0,0 +1,55 @@
+import io
+import os
+import sys
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ImageStore.image_processing import precheck_image
+
+
+def _encode(image, image_format):
+    output = io.BytesIO()
+    image.save(output, format=image_format)
+    return output.getvalue()
+
+
+def _text_lines(draw, left, top, bottom, step, color):
+    for i, y in enumerate(range(top, bottom, step)):
+        draw.rectangle([left, y, left + 300 + (i * 97) % 800, y + 10], fill=color)
+
+
+def _white_document():
+    image = Image.new('RGB', (1240, 1754), (255, 255, 255))
+    _text_lines(ImageDraw.Draw(image), 100, 100, 1600, 40, (20, 20, 20))
+    return image
+
+
+def _discord_screenshot():
+    image = Image.new('RGB', (1920, 1080), (49, 51, 56))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, 72, 1080], fill=(30, 31, 34))
+    draw.rectangle([72, 0, 312, 1080], fill=(43, 45, 49))
+    for y in range(20, 1000, 36):
+        draw.rectangle([90, y, 250, y + 10], fill=(148, 155, 164))
+    _text_lines(draw, 350, 50, 1000, 30, (220, 221, 222))
+    return image
+
+
+def test_white_document_passes():
+    for image_format in ('PNG', 'JPEG'):
+        assert precheck_image(_encode(_white_document(), image_format)) is None
+
+
+def test_light_screenshot_passes():
+    image = Image.new('RGB', (1920, 1080), (242, 243, 245))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, 300, 1080], fill=(255, 255, 255))
+    _text_lines(draw, 350, 50, 1000, 30, (30, 30, 30))
+    assert precheck_image(_encode(image, 'PNG')) is None
+
+
+def test_discord_screenshot_is_rejected():
+    for image_format in ('PNG', 'JPEG'):
+        assert 'Discord' in precheck_image(_encode(_discord_screenshot(), image_format))
@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 def is_dst_in_eastern_time(dt):
     """
@@ -102,4 +102,22 @@ def format_datetime(dt, include_timezone=False):
         is_dst = is_dst_in_eastern_time(dt)
         tz = "EDT" if is_dst else "EST"
         formatted += f" {tz}"
-    return formatted 
\ No newline at end of file
+    return formatted
+
+def parse_utc(value):
+    """
+    Parse an ISO timestamp returned by Supabase into a naive UTC datetime.
+    
+    Supabase may return timestamps with or without an offset; normalizing them lets them
+    be compared directly with datetime.utcnow().
+    
+    Args:
+        value (str | datetime): The timestamp to parse
+        
+    Returns:
+        datetime: The naive datetime in UTC
+    """
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt